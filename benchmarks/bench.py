@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmarks for the hot paths of marcx, run offline over synthetic records.
+
+Records come from `marcx.synth`, so runs with the same options benchmark the
+same records. Reports operations (records) per second and peak memory per
+benchmark as JSON. Results can be saved and compared against a stored baseline:
+
+    $ python benchmarks/bench.py --save baseline.json
+    $ python benchmarks/bench.py --compare baseline.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import marcx  # noqa: E402
+from marcx import synth  # noqa: E402
+
+
+def _version(distribution):
+    try:
+        from importlib.metadata import version
+        return version(distribution)
+    except Exception:
+        return None
+
+
+def to_document(record):
+    """
+    Convert a record into an Elasticsearch document as used by `marcdoc`.
+    """
+    content = {}
+    for field in record.get_fields():
+        if field.control_field:
+            content[field.tag] = field.data
+            continue
+        item = {'ind1': field.indicators[0], 'ind2': field.indicators[1]}
+        for subfield in field.subfields:
+            item[subfield.code] = subfield.value
+        content.setdefault(field.tag, []).append(item)
+    return {'_id': record['001'].data, '_index': 'bench', '_source': {'content': content}}
+
+
+def to_rows(record):
+    """
+    Convert a record into field tuples as taken by `Record.add_many`.
+    """
+    return [(field.tag, None, field.data) if field.control_field else
+            (field.tag, field.indicators, [(s.code, s.value) for s in field.subfields])
+            for field in record.get_fields()]
+
+
+def _fresh(records):
+    """
+    Return a function, which returns copies of `records` with copies of
+    their fields, so that mutating benchmarks start from the same state in
+    every round and do not change `records`.
+    """
+    rows = [(str(record.leader), to_rows(record)) for record in records]
+
+    def copies():
+        return [marcx.Record.from_fields(row, leader=leader, trusted=True)
+                for leader, row in rows]
+    return copies
+
+
+def benchmarks(records):
+    """
+    Return a dictionary mapping benchmark names to (setup, run) tuples.
+    `setup` returns the input of a round, `run` processes the input and
+    returns the number of operations done.
+    """
+    documents = [to_document(record) for record in records]
+    plain = [record.to_record() for record in records]
+    rows = [to_rows(record) for record in records]
+    data = [record.as_marc() for record in records]
+    same = lambda: records
+
+    def loop(function):
+        def run(items):
+            for item in items:
+                function(item)
+            return len(items)
+        return run
+
+    getter = marcx.valuegetter('020.a', '245.a', '650.a', '700.a')
+    fields = marcx.fieldgetter('020.a', '245.a', '650.a', '700.a')
+    startswith = marcx._startswith('978')
+    contains = lambda value: 'ver' in value
+    matches = marcx.query('020.a ^= "978" and not 912.a = "ZDB-1-X" and 245.a ~ /schaft/i')
+
+    def add(row):
+        record = marcx.Record()
+        for tag, indicators, content in row:
+            if indicators is None:
+                record.add(tag, data=content)
+                continue
+            kwargs = {}
+            for code, value in content:
+                kwargs.setdefault(code, []).append(value)
+            record.add(tag, indicators=indicators, **kwargs)
+
+    def add_many(row):
+        marcx.Record.from_fields(row)
+
+    def docs(run):
+        return lambda: documents, run
+
+    def decode(compact):
+        # Keeps all records, so the peak memory covers the decoded records.
+        def run(items):
+            return len([marcx.Record(data=item, compact=compact) for item in items])
+        return lambda: data, run
+
+    return {
+        'valuegetter': (same, loop(lambda r: list(getter(r)))),
+        'fieldgetter': (same, loop(lambda r: list(fields(r)))),
+        'add': (lambda: rows, loop(add)),
+        'add_many': (lambda: rows, loop(add_many)),
+        'remove': (_fresh(records), loop(lambda r: r.remove('650', '700.a', '935'))),
+        'remove_field_if': (_fresh(records), loop(lambda r: r.remove_field_if('264.b', contains))),
+        'test': (same, loop(lambda r: r.test('020.a', startswith))),
+        'test_all': (same, loop(lambda r: r.test('650.a', '700.a', contains, all=True))),
+        'query': (same, loop(matches)),
+        'firstvalue': (same, loop(lambda r: r.firstvalue('245.a'))),
+        'flatten': (same, loop(lambda r: r.flatten())),
+        'from_record': (lambda: plain, loop(marcx.Record.from_record)),
+        'to_record': (same, loop(lambda r: r.to_record())),
+        'as_marc': (same, loop(lambda r: r.as_marc())),
+        'decode': decode(False),
+        'decode_compact': decode(True),
+        'fingerprint': (same, loop(lambda r: r.fingerprint())),
+        'marcdoc_attributes': docs(loop(lambda d: (marcx.marcdoc(d).x245a,
+                                                   marcx.marcdoc(d).x650a))),
+        'dotdict': docs(loop(lambda d: marcx.DotDict(d)['_source'])),
+        'lazy_dotdict': docs(loop(lambda d: marcx.LazyDotDict(d)._source.content)),
+    }
+
+
+def measure(setup, run, min_time=0.2, repeat=3):
+    """
+    Return the best operations per second out of `repeat` rounds of at least
+    `min_time` seconds each and the peak memory of a single run in KiB.
+    """
+    best = 0.0
+    for _ in range(repeat):
+        ops, elapsed = 0, 0.0
+        while elapsed < min_time:
+            items = setup()
+            gc.collect()
+            started = time.perf_counter()
+            ops += run(items)
+            elapsed += time.perf_counter() - started
+        best = max(best, ops / elapsed)
+    items = setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(items)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'ops_per_sec': round(best, 1), 'peak_kib': round(peak / 1024.0, 1)}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline report, return the names of the
+    benchmarks, that got slower by more than `tolerance` (e.g. 0.1 for 10%).
+    """
+    slower = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        ratio = result['ops_per_sec'] / baseline[name]['ops_per_sec']
+        result['baseline_ratio'] = round(ratio, 3)
+        if ratio < 1 - tolerance:
+            slower.append(name)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--records', type=int, default=1000, help='records per round')
+    parser.add_argument('-p', '--profile', default='bibliographic', choices=sorted(synth.PROFILES),
+                        help='record profile, default: bibliographic')
+    parser.add_argument('--fields', type=float, default=1.0, help='scale repeatable fields')
+    parser.add_argument('--subfields', type=float, default=1.0, help='scale repeatable subfields')
+    parser.add_argument('--lengths', type=float, default=1.0, help='scale value lengths')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per round')
+    parser.add_argument('--repeat', type=int, default=3, help='rounds per benchmark')
+    parser.add_argument('-k', '--select', action='append',
+                        help='only run benchmarks containing this string (repeatable)')
+    parser.add_argument('--save', metavar='FILE', help='write the report to FILE')
+    parser.add_argument('--compare', metavar='FILE', help='compare with a saved report')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed slowdown against the baseline, default: 0.1')
+    args = parser.parse_args()
+
+    records = list(synth.generate(args.records, seed=args.seed, profile=args.profile,
+                                  fields=args.fields, subfields=args.subfields,
+                                  lengths=args.lengths))
+    results = {}
+    for name, (setup, run) in sorted(benchmarks(records).items()):
+        if args.select and not any(part in name for part in args.select):
+            continue
+        results[name] = measure(setup, run, args.min_time, args.repeat)
+        sys.stderr.write('%-20s %12.1f ops/s %10.1f KiB\n' % (
+            name, results[name]['ops_per_sec'], results[name]['peak_kib']))
+
+    report = {
+        'python': platform.python_version(),
+        'pymarc': _version('pymarc'),
+        'records': args.records,
+        'profile': args.profile,
+        'fields': args.fields,
+        'subfields': args.subfields,
+        'lengths': args.lengths,
+        'seed': args.seed,
+        'results': results,
+    }
+    if 'decode' in results and 'decode_compact' in results:
+        report['compact_memory_ratio'] = round(
+            results['decode']['peak_kib'] / results['decode_compact']['peak_kib'], 2)
+    slower = []
+    if args.compare:
+        with open(args.compare) as handle:
+            slower = compare(results, json.load(handle)['results'], args.tolerance)
+        report['slower'] = slower
+    if args.save:
+        with open(args.save, 'w') as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
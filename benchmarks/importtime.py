@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Measure the import time of marcx with `python -X importtime`.
+
+Runs `python -X importtime -c "import marcx"` a number of times and writes
+a JSON report with the median cumulative import time of marcx and its
+slowest dependencies to stdout, e.g.:
+
+    $ python benchmarks/importtime.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def importtime(module='marcx'):
+    """
+    Import `module` in a fresh interpreter and return a dictionary mapping
+    module names to (self, cumulative) import times in microseconds.
+    """
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                            cwd=ROOT, stderr=subprocess.PIPE, check=True,
+                            universal_newlines=True).stderr
+    timings = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = (int(own), int(cumulative))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='number of imports')
+    parser.add_argument('--top', type=int, default=10, help='number of slow dependencies to show')
+    parser.add_argument('--module', default='marcx', help='module to import')
+    args = parser.parse_args()
+
+    runs = [importtime(args.module) for _ in range(args.runs)]
+    cumulative = [run[args.module][1] for run in runs]
+    last = runs[-1]
+    slowest = sorted(((own, name) for name, (own, _) in last.items()
+                      if name != args.module), reverse=True)[:args.top]
+    report = {
+        'module': args.module,
+        'runs': args.runs,
+        'median_us': statistics.median(cumulative),
+        'min_us': min(cumulative),
+        'max_us': max(cumulative),
+        'modules': len(last),
+        'jsonpath_rw': 'jsonpath_rw' in last,
+        'slowest_self_us': [{'module': name, 'self_us': own} for own, name in slowest],
+    }
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
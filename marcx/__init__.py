@@ -0,0 +1,2970 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Few extensions on `pymarc.Record` to make certain checks
+and manipulations a bit easier.
+"""
+
+try:
+    from collections.abc import Iterable, Mapping  # noqa
+except ImportError:
+    from collections import Iterable, Mapping  # noqa
+import array
+import collections
+import functools
+import hashlib
+import itertools
+import json
+import mmap
+import operator
+import os
+import re
+import sys
+import warnings
+import xml.etree.ElementTree as ET
+from builtins import zip
+
+import pymarc
+
+__version__ = '0.3.0'
+
+__all__ = [
+    'Record',
+    'FatRecord',  # Deprecated, use Record instead.
+    'marcdoc',
+    'valuegetter',
+    'fieldgetter',
+    'FieldSpec',
+    'fieldspec',
+    'query',
+    'any_prefix',
+    'any_substring',
+    'CompactField',
+    'test_many',
+    'ListColumn',
+    'extract',
+    'iterextract',
+    'process',
+    'LazyRecord',
+    'iter_lazy',
+    'build_index',
+    'IndexedFile',
+    'apply_delta',
+    'group_by',
+    'ChangeLog',
+    'write_corpus',
+    'iter_xml',
+    'XMLWriter',
+]
+
+
+class DotDict(dict):
+    """ Dot access for dictionaries. """
+
+    def __init__(self, d=None, **kwargs):
+        if d is None:
+            d = {}
+        if kwargs:
+            d.update(**kwargs)
+        for k, v in list(d.items()):
+            setattr(self, k, v)
+        for k in list(self.__class__.__dict__.keys()):
+            if not (k.startswith('__') and k.endswith('__')):
+                setattr(self, k, getattr(self, k))
+
+    def __setattr__(self, name, value):
+        if isinstance(value, (list, tuple)):
+            value = [self.__class__(x) if isinstance(x, dict) else x for x in value]
+        else:
+            value = self.__class__(value) if isinstance(value, dict) else value
+        super(DotDict, self).__setattr__(name, value)
+        self[name] = value
+
+
+class LazyDotDict(DotDict):
+    """
+    Dot access for dictionaries, nested values are wrapped on first access.
+
+    Unlike `DotDict` values are only stored as items and nested dictionaries
+    (and dictionaries in lists) get wrapped - and stored back - only when they
+    are accessed, so wrapping a large document is about as cheap as copying
+    its top-level keys:
+
+    >>> d = LazyDotDict({'a': 'A', 'b': {'c': {'d': ['e', 'f']}}})
+    >>> d.b.c.d[1]
+    'f'
+
+    `get`, `values` and `items` wrap values as well, `values` and `items`
+    return lists. Keys named like dict methods (`get`, `items`, `keys`,
+    `values`, ...) are only accessible as items, e.g. `d['values']`, since
+    attribute access returns the method.
+    """
+
+    def __init__(self, d=None, **kwargs):
+        dict.__init__(self, d or (), **kwargs)
+
+    def _wrap(self, key, value):
+        """
+        Wrap a plain dictionary or a list containing plain dictionaries and
+        store the result under `key`.
+        """
+        cls = self.__class__
+        if type(value) is dict:
+            value = cls(value)
+        elif isinstance(value, (list, tuple)):
+            if not any(type(v) is dict for v in value):
+                return value
+            value = [cls(v) if type(v) is dict else v for v in value]
+        else:
+            return value
+        dict.__setitem__(self, key, value)
+        return value
+
+    def __getitem__(self, key):
+        return self._wrap(key, dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self._wrap(key, dict.__getitem__(self, key))
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def __getattr__(self, name):
+        try:
+            value = dict.__getitem__(self, name)
+        except KeyError:
+            raise AttributeError(name)
+        return self._wrap(name, value)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def _equals(value):
+    """
+    Equality test.
+    """
+    return lambda v: value == v
+
+
+def _not(value):
+    """
+    Usage example: `_not(_equal(...))`.
+    """
+    if hasattr(value, '__call__'):
+        return lambda v: not value(v)
+    else:
+        return lambda v: not v
+
+
+def _match(value):
+    """
+    Maps to `re.match` (match at the beginning of `v`), the pattern is
+    compiled once.
+    """
+    return re.compile(value).match
+
+
+def _search(value):
+    """
+    Maps to `re.search` (match anywhere in `v`), the pattern is compiled
+    once.
+    """
+    return re.compile(value).search
+
+
+def _startswith(value):
+    """
+    Maps to `string.startswith`.
+    """
+    return lambda v: v.startswith(value)
+
+
+def _endswith(value):
+    """
+    Maps to `string.endswith`.
+    """
+    return lambda v: v.endswith(value)
+
+
+def _literals(patterns, ignorecase):
+    if isinstance(patterns, str):
+        patterns = (patterns,)
+    if ignorecase:
+        return [pattern.casefold() for pattern in patterns]
+    return list(patterns)
+
+
+def any_prefix(patterns, ignorecase=False):
+    """
+    Return a predicate, which is true for values starting with any of the
+    given strings. The strings are put into a trie once, so testing a value
+    takes time proportional to the length of the value, not to the number
+    of prefixes:
+
+    >>> is_isil = any_prefix(['DE-15', 'DE-14', 'DE-Ch1'])
+    >>> record.test('912.a', is_isil)
+    True
+    >>> record.remove_field_if('912.a', is_isil)
+    """
+    end = ''
+    trie = {}
+    for pattern in sorted(_literals(patterns, ignorecase), key=len):
+        node = trie
+        for char in pattern:
+            if end in node:
+                break
+            node = node.setdefault(char, {})
+        else:
+            node[end] = True
+
+    def matches(value):
+        if ignorecase:
+            value = value.casefold()
+        node = trie
+        for char in value:
+            if end in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return end in node
+    return matches
+
+
+def any_substring(patterns, ignorecase=False):
+    """
+    Return a predicate, which is true for values containing any of the
+    given strings. The strings are compiled into an Aho-Corasick automaton
+    once, so testing a value takes time proportional to the length of the
+    value, not to the number of substrings:
+
+    >>> is_springer = any_substring(['Springer', 'Birkhäuser'], ignorecase=True)
+    >>> record.test('260.b', '264.b', is_springer)
+    True
+    """
+    goto, final = [{}], [False]
+    for pattern in _literals(patterns, ignorecase):
+        state = 0
+        for char in pattern:
+            if char not in goto[state]:
+                goto.append({})
+                final.append(False)
+                goto[state][char] = len(goto) - 1
+            state = goto[state][char]
+        final[state] = True
+
+    # Breadth first, so the failure state of a state is set before its
+    # children are visited.
+    fail = [0] * len(goto)
+    queue = collections.deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, child in goto[state].items():
+            queue.append(child)
+            target = fail[state]
+            while target and char not in goto[target]:
+                target = fail[target]
+            fail[child] = goto[target].get(char, 0)
+            final[child] = final[child] or final[fail[child]]
+
+    def matches(value):
+        if final[0]:
+            return True
+        if ignorecase:
+            value = value.casefold()
+        state = 0
+        for char in value:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if final[state]:
+                return True
+        return False
+    return matches
+
+
+def pairwise(iterable):
+    """
+    s -> (s0, s1), (s2, s3), (s4, s5), ...
+    """
+    it = iter(iterable)
+    return zip(it, it)
+
+
+_FIELDSPEC_PATTERN = re.compile(r'(?P<field>[^.]+)(.(?P<subfield>[^.]+))?')
+
+
+class FieldSpec(object):
+    """
+    A parsed fieldspec, like `001`, `020` or `020.a`. Do not create
+    instances directly, use `fieldspec`, which caches parsed specs
+    process-wide.
+    """
+    __slots__ = ('spec', 'tag', 'code', 'is_control')
+
+    def __init__(self, spec, tag, code=None):
+        self.spec = spec
+        self.tag = tag
+        self.code = code
+        self.is_control = tag.isdigit() and int(tag) < 10
+
+    def __repr__(self):
+        return 'FieldSpec(%r)' % self.spec
+
+    def __eq__(self, other):
+        return isinstance(other, FieldSpec) and self.spec == other.spec
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.spec)
+
+    def values(self, field, combine_subfields=False):
+        """
+        Return the values of `field` matched by this spec, as a list.
+        """
+        if self.code:
+            return field.get_subfields(self.code)
+        if combine_subfields or self.is_control:
+            return [field.value()]
+        return [value for values in field.subfields_as_dict().values()
+                for value in values]
+
+    def occurs_in(self, field):
+        """
+        Return `True`, if this spec matches at least one value in `field`.
+        """
+        if self.code:
+            return self.code in field
+        if self.is_control:
+            return True
+        return bool(field.subfields)
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_fieldspec(spec):
+    match = _FIELDSPEC_PATTERN.match(spec)
+    if not match:
+        return None
+    return FieldSpec(spec, match.group('field'), match.group('subfield'))
+
+
+def fieldspec(spec):
+    """
+    Return the `FieldSpec` for a string like `020.a` or `None`, if the
+    spec cannot be parsed. `FieldSpec` instances are returned as is.
+    """
+    if isinstance(spec, FieldSpec):
+        return spec
+    return _parse_fieldspec(spec)
+
+
+def _compile_fieldspecs(fieldspecs):
+    """
+    Turn a sequence of fieldspecs into a list of `FieldSpec`,
+    skipping specs that cannot be parsed.
+    """
+    return [spec for spec in map(fieldspec, fieldspecs) if spec is not None]
+
+
+def _split_test_args(args, default):
+    """
+    Separate fieldspecs and the test function in `args`, as passed to
+    `Record.test`. Returns a (fieldspecs, function) tuple.
+    """
+    fieldspecs = []
+    function = default
+    for arg in args:
+        if callable(arg):
+            function = arg
+        elif isinstance(arg, (str, FieldSpec)):
+            if arg not in fieldspecs:
+                fieldspecs.append(arg)
+        else:
+            raise ValueError('argument must be callable (test function) '
+                             'or str (fieldspec, like 020.a '
+                             'or 856.u, etc.)')
+    return fieldspecs, function
+
+
+def _test_values(values, function, all=False):
+    """
+    Apply `function` to `values` until the outcome is known. With `all`,
+    every value must pass, otherwise one passing value suffices. No values
+    at all never pass.
+    """
+    if all:
+        passed = False
+        for value in values:
+            if not function(value):
+                return False
+            passed = True
+        return passed
+    for value in values:
+        if function(value):
+            return True
+    return False
+
+
+def test_many(records, *args, **kwargs):
+    """
+    Run the same test as `Record.test` over an iterable of records. Specs
+    and the test function are prepared once. Returns a `bytearray` with
+    one entry per record, 1 if the record passed the test, 0 otherwise.
+
+    >>> mask = test_many(records, '020.a', _startswith('978'), all=True)
+    >>> [r for r, passed in zip(records, mask) if passed]
+    """
+    fieldspecs, function = _split_test_args(args, lambda val: True)
+    getter = valuegetter(*fieldspecs)
+    every = kwargs.get('all', False)
+    return bytearray(_test_values(getter(record), function, every)
+                     for record in records)
+
+
+@functools.lru_cache(maxsize=1024)
+def _fieldspec_table(fieldspecs):
+    """
+    Group a tuple of fieldspecs by tag, returns a dictionary mapping tags
+    to tuples of `FieldSpec`.
+    """
+    table = {}
+    for spec in _compile_fieldspecs(fieldspecs):
+        if spec not in table.get(spec.tag, ()):
+            table[spec.tag] = table.get(spec.tag, ()) + (spec,)
+    return table
+
+
+@functools.lru_cache(maxsize=1024)
+def _subfield_table(fieldspecs):
+    """
+    Map tags to the set of subfield codes given by a tuple of fieldspecs;
+    `None` stands for the whole field.
+    """
+    table = {}
+    for tag, specs in _fieldspec_table(fieldspecs).items():
+        if any(spec.code is None for spec in specs):
+            table[tag] = None
+        else:
+            table[tag] = frozenset(spec.code for spec in specs)
+    return table
+
+
+def valuegetter(*fieldspecs, **kwargs):
+    """
+    Modelled after `operator.itemgetter`. Takes a variable
+    number of specs and returns a function, which applied to
+    any `pymarc.Record` returns the matching values.
+
+    Specs are in the form `field` or `field.subfield`, e.g.
+    `020` or `020.9`.
+
+    Example:
+
+    >>> from marcx import Record, valuegetter
+    >>> from urllib import urlopen
+    >>> record = Record(data=urlopen("http://goo.gl/lfJnw9").read())
+
+    In two steps:
+
+    >>> getter = valuegetter('020.a')
+    >>> getter(record)
+    <generator object values at 0x2d97690>
+
+    >>> set(getter(record))
+    set(['020161622X'])
+
+    Or in one step:
+
+    >>> set(valuegetter('020.a')(record))
+    set(['020161622X'])
+
+    A variable number of specs can be passed:
+
+    >>> set(valuegetter('001', '005', '700.a')(record))
+    set(['20040816084925.0', 'Thomas, David,', '11778504'])
+
+    Non-existent field tags can be passed - they are ignored:
+    >>> set(valuegetter('002')(record))
+    set([])
+
+    Specs are parsed once, when the getter is created.
+
+    @see also: `Record.itervalues`
+    """
+    combine_subfields = kwargs.get('combine_subfields', False)
+    specs = _compile_fieldspecs(fieldspecs)
+
+    def values(record):
+        get_fields = getattr(record, '_read_fields', record.get_fields)
+        for spec in specs:
+            for field in get_fields(spec.tag):
+                for value in spec.values(field, combine_subfields):
+                    yield value
+    values.__doc__ = 'returns a value generator over %s' % (
+        ', '.join(spec.spec for spec in specs))
+    return values
+
+
+def fieldgetter(*fieldspecs):
+    """
+    Similar to `valuegetter`, except this returns (`pymarc.Field`, value)
+    tuples. Takes any number of fieldspecs.
+    """
+    specs = _compile_fieldspecs(fieldspecs)
+
+    def fields(record):
+        for spec in specs:
+            for field in record.get_fields(spec.tag):
+                if spec.code:
+                    for value in field.get_subfields(spec.code):
+                        yield field, value
+                elif spec.is_control:
+                    yield field, field.value()
+                else:
+                    for subfield in field.subfields:
+                        yield field, subfield.value
+    fields.__doc__ = 'returns a field generator over %s' % (
+        ', '.join(spec.spec for spec in specs))
+    return fields
+
+
+_QUERY_TOKEN = re.compile(r"""\s*(?:
+    (?P<paren>[()])|
+    (?P<op>\^=|\$=|\*=|!=|=|~)|
+    (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')|
+    (?P<regex>/(?:[^/\\]|\\.)*/[a-zA-Z]*)|
+    (?P<word>[0-9A-Za-z]+(?:\.[0-9A-Za-z]+)?)
+)""", re.VERBOSE)
+
+_QUERY_KEYWORDS = ('and', 'or', 'not')
+
+_QUERY_TOKEN_NAMES = {'word': 'fieldspec', 'regex': 'regular expression'}
+
+_REGEX_FLAGS = {'i': re.IGNORECASE, 'm': re.MULTILINE, 's': re.DOTALL, 'x': re.VERBOSE}
+
+# Operators mapping a literal to a predicate over single values, `!=` is
+# handled as negated `=`.
+_QUERY_OPERATORS = {
+    '=': _equals,
+    '^=': _startswith,
+    '$=': _endswith,
+    '*=': lambda literal: lambda v: literal in v,
+}
+
+
+def _tokenize_query(expr):
+    """
+    Split a query into (kind, text, position) tuples.
+    """
+    tokens, pos, expr = [], 0, expr.rstrip()
+    while pos < len(expr):
+        match = _QUERY_TOKEN.match(expr, pos)
+        if not match:
+            raise ValueError('invalid query at position %d: %r' % (pos, expr))
+        kind = match.lastgroup
+        text, start = match.group(kind), match.start(kind)
+        if kind == 'word' and text.lower() in _QUERY_KEYWORDS:
+            kind = text = text.lower()
+        tokens.append((kind, text, start))
+        pos = match.end()
+    return tokens
+
+
+class _QueryParser(object):
+    """
+    Recursive descent parser turning a query into a closure tree. Every
+    node is compiled into a (function, clauses) tuple, where function takes a
+    dictionary mapping tags to lists of fields and clauses is a list of tag
+    sets, each of which must intersect with the tags of a matching record.
+    """
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.tokens = _tokenize_query(expr)
+        self.pos = 0
+        self.tags = set()
+
+    def error(self, message):
+        if self.pos < len(self.tokens):
+            where = 'position %d' % self.tokens[self.pos][2]
+        else:
+            where = 'end of query'
+        return ValueError('%s at %s: %r' % (message, where, self.expr))
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][0]
+        return None
+
+    def take(self, *kinds):
+        if self.peek() not in kinds:
+            raise self.error('expected %s' % ' or '.join(
+                _QUERY_TOKEN_NAMES.get(kind, kind) for kind in kinds))
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token[1]
+
+    def parse(self):
+        node = self.disjunction()
+        if self.peek() is not None:
+            raise self.error('unexpected token')
+        return node
+
+    def disjunction(self):
+        nodes = [self.conjunction()]
+        while self.peek() == 'or':
+            self.take('or')
+            nodes.append(self.conjunction())
+        if len(nodes) == 1:
+            return nodes[0]
+        functions = [function for function, _ in nodes]
+        if all(clauses for _, clauses in nodes):
+            clauses = [frozenset().union(*(tags for _, clauses in nodes
+                                           for tags in clauses))]
+        else:
+            clauses = []
+        return lambda groups: any(function(groups) for function in functions), clauses
+
+    def conjunction(self):
+        nodes = [self.negation()]
+        while self.peek() == 'and':
+            self.take('and')
+            nodes.append(self.negation())
+        if len(nodes) == 1:
+            return nodes[0]
+        functions = [function for function, _ in nodes]
+        clauses = [tags for _, clauses in nodes for tags in clauses]
+        return lambda groups: all(function(groups) for function in functions), clauses
+
+    def negation(self):
+        if self.peek() != 'not':
+            return self.atom()
+        self.take('not')
+        function, _ = self.negation()
+        return lambda groups: not function(groups), []
+
+    def atom(self):
+        if self.peek() == 'paren':
+            if self.take('paren') != '(':
+                self.pos -= 1
+                raise self.error('unexpected token')
+            node = self.disjunction()
+            if self.take('paren') != ')':
+                self.pos -= 1
+                raise self.error('expected )')
+            return node
+        spec = fieldspec(self.take('word'))
+        self.tags.add(spec.tag)
+        if self.peek() != 'op':
+            return self.existence(spec), [frozenset((spec.tag,))]
+        op = self.take('op')
+        if op == '~':
+            literal = self.take('string', 'regex')
+        else:
+            literal = self.take('string')
+        predicate = self.predicate(op, literal)
+        function = self.comparison(spec, predicate)
+        if op == '!=':
+            return lambda groups: not function(groups), []
+        return function, [frozenset((spec.tag,))]
+
+    def predicate(self, op, literal):
+        """
+        Return a predicate over single values, regular expressions are
+        compiled here, once.
+        """
+        if literal.startswith('/'):
+            end = literal.rindex('/')
+            flags = 0
+            for flag in literal[end + 1:]:
+                if flag not in _REGEX_FLAGS:
+                    self.pos -= 1
+                    raise self.error('unknown regular expression flag %r' % flag)
+                flags |= _REGEX_FLAGS[flag]
+            pattern = literal[1:end].replace('\\/', '/')
+        else:
+            flags = 0
+            quote = literal[0]
+            # Keep escapes for regular expressions, e.g. "\d+", except for
+            # escaped quotes.
+            pattern = literal[1:-1].replace('\\' + quote, quote)
+            literal = re.sub(r'\\(.)', r'\1', literal[1:-1])
+        if op == '~':
+            try:
+                return re.compile(pattern, flags).search
+            except re.error as err:
+                self.pos -= 1
+                raise self.error('invalid regular expression (%s)' % err)
+        return _QUERY_OPERATORS[op.lstrip('!')](literal)
+
+    @staticmethod
+    def existence(spec):
+        def function(groups):
+            return any(spec.occurs_in(field) for field in groups.get(spec.tag, ()))
+        return function
+
+    @staticmethod
+    def comparison(spec, predicate):
+        def function(groups):
+            for field in groups.get(spec.tag, ()):
+                for value in spec.values(field):
+                    if predicate(value):
+                        return True
+            return False
+        return function
+
+
+@functools.lru_cache(maxsize=1024)
+def query(expr):
+    """
+    Compile a query into a function, which applied to a `pymarc.Record`
+    returns `True` or `False`. A query compares fieldspecs with string
+    literals or regular expressions and combines the comparisons with
+    `and`, `or`, `not` and parentheses:
+
+    >>> is_book = query('020.a ^= "978" and not 912.a = "ZDB-1-X" and 245.a ~ /foo/i')
+    >>> is_book(record)
+    True
+    >>> [r for r in records if is_book(r)]
+
+    Operators are `=` (equals), `!=` (no value equals), `^=` (starts with),
+    `$=` (ends with), `*=` (contains) and `~` (regular expression search,
+    either `/.../flags` with flags from `imsx` or a quoted string). Like
+    `Record.test` a comparison holds, if any value matches. A fieldspec on
+    its own checks for presence, like `Record.has`.
+
+    Queries are parsed once and cached. Records without the tags a query
+    requires are rejected before any value is looked at.
+
+    @see also: `Record.matches`
+    """
+    parser = _QueryParser(expr)
+    function, clauses = parser.parse()
+    tags = tuple(sorted(parser.tags))
+
+    def matches(record):
+        groups = {}
+        get_fields = getattr(record, '_read_fields', record.get_fields)
+        for field in get_fields(*tags):
+            groups.setdefault(field.tag, []).append(field)
+        for required in clauses:
+            if required.isdisjoint(groups):
+                return False
+        return function(groups)
+    matches.__doc__ = 'returns True for records matching %s' % expr
+    return matches
+
+
+_INDICATORS = {}
+
+
+def _shared_indicators(indicators):
+    """
+    Return a shared `pymarc.Indicators` instance equal to `indicators`.
+    """
+    if indicators is None:
+        return None
+    return _INDICATORS.setdefault(tuple(indicators), indicators)
+
+
+class CompactField(pymarc.Field):
+    """
+    A `pymarc.Field` with a smaller memory footprint: subfield codes are
+    kept in a single (interned) string and subfield values in another one,
+    joined by the MARC subfield delimiter. Tags and indicators are shared
+    between fields.
+
+    The `subfields` attribute is still available, but it is assembled on
+    each access; modify subfields through the `Field` methods or by
+    assigning a new list to `subfields`.
+    """
+    __slots__ = ('_codes', '_values')
+
+    def __init__(self, tag, indicators=None, subfields=None, data=None):
+        super(CompactField, self).__init__(tag, indicators=indicators,
+                                           subfields=subfields, data=data)
+        self.tag = sys.intern(self.tag)
+        self._indicators = _shared_indicators(self._indicators)
+
+    @classmethod
+    def from_field(cls, field):
+        """
+        Return a compact copy of `field` or `field` itself, if it is
+        compact already.
+        """
+        if isinstance(field, cls):
+            return field
+        if field.control_field:
+            return cls(field.tag, data=field.data)
+        return cls(field.tag, field.indicators, field.subfields)
+
+    @property
+    def subfields(self):
+        if not self._codes:
+            return []
+        return [pymarc.Subfield(code, value) for code, value in
+                zip(self._codes, self._values.split('\x1f'))]
+
+    @subfields.setter
+    def subfields(self, subfields):
+        codes = ''.join(subfield[0] for subfield in subfields)
+        if len(codes) != len(subfields):
+            raise ValueError('compact fields take single character subfield codes')
+        values = '\x1f'.join(subfield[1] for subfield in subfields)
+        if codes and values.count('\x1f') != len(codes) - 1:
+            raise ValueError('compact fields take no subfield delimiters in values')
+        self._codes = sys.intern(codes)
+        self._values = values
+
+    def __iter__(self):
+        return iter(self.subfields)
+
+    def __contains__(self, code):
+        # Codes are single characters, longer strings never match.
+        return len(code) == 1 and code in self._codes
+
+    def get(self, code, default=None):
+        if len(code) != 1:
+            return default
+        index = self._codes.find(code)
+        if index < 0:
+            return default
+        return self._values.split('\x1f')[index]
+
+    def __getitem__(self, code):
+        if self.control_field or code not in self:
+            raise KeyError
+        return self.get(code)
+
+    def __setitem__(self, code, value):
+        if self.control_field:
+            raise KeyError('field is a control field')
+        if len(code) != 1 or self._codes.count(code) != 1:
+            raise KeyError("no or more than one code '%s'" % code)
+        if '\x1f' in value:
+            raise ValueError('compact fields take no subfield delimiters in values')
+        values = self._values.split('\x1f')
+        values[self._codes.index(code)] = value
+        self._values = '\x1f'.join(values)
+
+    def get_subfields(self, *codes):
+        if not any(code in self for code in codes):
+            return []
+        return [value for code, value in zip(self._codes, self._values.split('\x1f'))
+                if code in codes]
+
+    def subfields_as_dict(self):
+        subs = {}
+        if self._codes:
+            for code, value in zip(self._codes, self._values.split('\x1f')):
+                subs.setdefault(code, []).append(value)
+        return subs
+
+    def add_subfield(self, code, value, pos=None):
+        if self.control_field:
+            return None
+        subfields = self.subfields
+        if pos is None or pos > len(subfields):
+            pos = len(subfields)
+        subfields.insert(pos, pymarc.Subfield(code, value))
+        self.subfields = subfields
+
+    def delete_subfield(self, code):
+        if self.control_field or code not in self:
+            return None
+        subfields = self.subfields
+        value = subfields.pop(self._codes.index(code)).value
+        self.subfields = subfields
+        return value
+
+
+class Record(pymarc.Record):
+    """
+    A record with some extras.
+    """
+    E_NO_INDICATORS = """control fields take no indicators
+    see: http://www.loc.gov/marc/bibliographic/bd00x.html"""
+    E_NO_SUBFIELDS = """control fields take no subfields
+    see: http://www.loc.gov/marc/bibliographic/bd00x.html"""
+    E_NO_DATA = "non-control fields take no data"
+    E_EMPTY = "data must not be empty"
+    E_INVALID_INDICATOR = "invalid indicator"
+
+    # Set `tag_index` to `True` on a record to answer tag lookups from a
+    # tag -> fields mapping instead of scanning all fields. The methods of
+    # the record keep the index up to date; after any direct edit of the
+    # `fields` list (e.g. `fields.remove(x)`, `fields[i] = y`) call
+    # `invalidate_index`, otherwise lookups may return stale fields.
+    tag_index = False
+    _tagindex = None
+
+    # Store fields as `CompactField`, see `compact`.
+    compact_fields = False
+
+    def __init__(self, *args, **kwargs):
+        if kwargs.pop('compact', False):
+            self.compact_fields = True
+        super(Record, self).__init__(*args, **kwargs)
+        self.strict = True
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Factory methods to create Record from pymarc.Record object.
+        """
+        if not isinstance(record, pymarc.Record):
+            raise TypeError('record must be of type pymarc.Record')
+        new_record = Record()
+        new_record.leader = record.leader
+        new_record.fields = record.fields
+        new_record.pos = record.pos
+        new_record.force_utf8 = record.force_utf8
+        new_record.to_unicode = record.to_unicode
+        new_record.strict = True
+        return new_record
+
+    def to_record(self):
+        """
+        Convert Record to a pymarc.Record class. This is partially
+        addressed in https://github.com/edsu/pymarc/pull/36.
+        """
+        record = pymarc.Record()
+        record.leader = self.leader
+        record.fields = self.fields
+        record.pos = self.pos
+        record.force_utf8 = self.force_utf8
+        record.to_unicode = self.to_unicode
+        return record
+
+    def _fields_by_tag(self):
+        """
+        Return a dictionary mapping tags to lists of fields. The index is
+        built on first use and rebuilt, if `fields` has been replaced or
+        changed its length. This only catches some direct edits of the list,
+        e.g. not a removal followed by an append, so these require a call
+        to `invalidate_index`.
+        """
+        fields = self.fields
+        index = self._tagindex
+        if index is None or index[0] is not fields or index[1] != len(fields):
+            tags = {}
+            for field in fields:
+                tags.setdefault(field.tag, []).append(field)
+            index = self._tagindex = (fields, len(fields), tags)
+        return index[2]
+
+    def invalidate_index(self):
+        """
+        Drop the tag index; it is rebuilt on the next lookup.
+        """
+        self._tagindex = None
+
+    def get_fields(self, *args):
+        """
+        Like `pymarc.Record.get_fields`, but uses the tag index for single
+        tag lookups, if `tag_index` is set.
+        """
+        if self.tag_index and len(args) == 1:
+            return list(self._fields_by_tag().get(args[0], ()))
+        return super(Record, self).get_fields(*args)
+
+    def _read_fields(self, *args):
+        # Like `get_fields`, for callers that do not hand out the fields,
+        # see `LazyRecord.as_marc`.
+        return self.get_fields(*args)
+
+    def _field_class(self):
+        return CompactField if self.compact_fields else pymarc.Field
+
+    def compact(self):
+        """
+        Convert all fields to `CompactField` and keep using compact fields
+        for fields added later on, at the expense of slower subfield access.
+        Cuts the memory used by typical bibliographic or holdings records
+        by about 2.5 times, short of a factor of three, since each field is
+        still a `pymarc.Field` object; records with many subfields per field
+        save more (see the `decode_compact` benchmark).
+        Records can also be created compact with `Record(data, compact=True)`.
+        Returns the record itself.
+        """
+        self.compact_fields = True
+        self.fields[:] = [CompactField.from_field(field) for field in self.fields]
+        self._tagindex = None
+        return self
+
+    def add_field(self, *fields):
+        if self.compact_fields:
+            fields = [CompactField.from_field(field) for field in fields]
+        index = self._tagindex
+        super(Record, self).add_field(*fields)
+        if index is None:
+            return
+        if index[0] is self.fields and index[1] + len(fields) == len(self.fields):
+            tags = index[2]
+            for field in fields:
+                tags.setdefault(field.tag, []).append(field)
+            self._tagindex = (index[0], len(self.fields), tags)
+        else:
+            self._tagindex = None
+
+    def remove_field(self, *fields):
+        index = self._tagindex
+        try:
+            super(Record, self).remove_field(*fields)
+        finally:
+            self._tagindex = None
+        if index is not None and index[0] is self.fields and index[1] - len(fields) == len(self.fields):
+            tags = index[2]
+            for field in fields:
+                tags[field.tag].remove(field)
+            self._tagindex = (index[0], len(self.fields), tags)
+
+    def remove_fields(self, *tags):
+        self._tagindex = None
+        return super(Record, self).remove_fields(*tags)
+
+    def add_grouped_field(self, *fields):
+        self._tagindex = None
+        return super(Record, self).add_grouped_field(*fields)
+
+    def add_ordered_field(self, *fields):
+        self._tagindex = None
+        return super(Record, self).add_ordered_field(*fields)
+
+    def add(self, tag, data=None, indicators=None, **kwargs):
+        """
+        Add a field to a record. Example:
+
+        marc.add('020', a='0201657880', z='0201802398')
+        """
+        if tag.startswith("00") and (data is None or data == "") and not self.strict:
+            return
+
+        if data:
+            if indicators:
+                raise ValueError(Record.E_NO_INDICATORS)
+            if not tag.startswith('00'):
+                raise ValueError(Record.E_NO_DATA)
+        else:
+            if tag.startswith('00'):
+                raise ValueError(Record.E_EMPTY)
+
+        if tag.startswith('00') and kwargs:
+            raise ValueError(Record.E_NO_SUBFIELDS)
+
+        if indicators is None:
+            indicators = [' ', ' ']
+        if isinstance(indicators, str):
+            if len(indicators) == 2:
+                indicators = [indicators[0], indicators[1]]
+            else:
+                raise ValueError(Record.E_INVALID_INDICATOR)
+
+        if data:  # == control field (001 -- 009)
+            field = self._field_class()(tag, data=data)
+        else:     # == non-control field (010 -- 999)
+            if 'subfields' in kwargs:
+                sfs = kwargs['subfields']
+                if len(sfs) > 0 and not isinstance(sfs[0], str):
+                    # TODO: this is just a workaround, do not use legacy
+                    # internal format any more.
+                    subfields = list(itertools.chain.from_iterable([(f.code, f.value) for f in sfs]))
+                subfields = [v for sl in [(a, b) for a, b in zip(sfs[::2], sfs[1::2]) if b] for v in sl]
+            else:
+                subfields = []
+                for key, value in kwargs.items():
+                    if value is None:
+                        continue
+                    key = key.replace('_', '')
+                    if isinstance(value, str):
+                        if value == "":
+                            continue
+                        subfields += [key, value]
+                    elif isinstance(value, Iterable):
+                        for val in value:
+                            if not isinstance(val, str):
+                                raise ValueError('subfield values must be strings')
+                            if val:
+                                subfields += [key, val]
+                    else:
+                        raise ValueError('subfield values must be strings')
+
+            if not any(subfields[1::2]):
+                if self.strict:
+                    raise ValueError('none of the subfields contains a value')
+                else:
+                    return
+            # pymarc 5 compat
+            # https://pymarc.readthedocs.io/en/latest/index.html#pymarc.field.Field.convert_legacy_subfields
+            subfields = pymarc.field.Field.convert_legacy_subfields(subfields)
+
+            field = self._field_class()(tag, indicators, subfields=subfields)
+        self.add_field(field)
+
+    def add_many(self, rows, trusted=False):
+        """
+        Add many fields at once. Fields are given as tuples, for control
+        fields as (tag, None, data), for other fields as
+        (tag, indicators, [(code, value), ...]), e.g.:
+
+        >>> record.add_many([
+        ...     ('001', None, '12345'),
+        ...     ('020', None, [('a', '9780201616224'), ('z', '020161622X')]),
+        ...     ('245', '10', [('a', 'The pragmatic programmer :')]),
+        ... ])
+
+        Indicators default to blanks. Rows are checked like in `add`, i.e.
+        empty subfield values are dropped and empty fields raise a
+        `ValueError` (or are skipped, if the record is not `strict`). With
+        `trusted=True`, rows are turned into fields without any checks; rows
+        with a string as content become control fields, also for
+        non-numeric tags like the `FMT` of Aleph exports.
+        """
+        field_class = self._field_class()
+        make_subfield = pymarc.Subfield._make
+        fields = []
+        if trusted:
+            for tag, indicators, content in rows:
+                if isinstance(content, str):
+                    fields.append(_control_field(field_class, tag, content))
+                else:
+                    fields.append(field_class(tag, indicators and tuple(indicators),
+                                              list(map(make_subfield, content))))
+            self.add_field(*fields)
+            return
+
+        for tag, indicators, content in rows:
+            if not isinstance(tag, str):
+                raise ValueError('tag must be a string')
+            if tag.startswith('00'):
+                if indicators:
+                    raise ValueError(Record.E_NO_INDICATORS)
+                if not isinstance(content, str):
+                    raise ValueError(Record.E_NO_SUBFIELDS)
+                if not content:
+                    if self.strict:
+                        raise ValueError(Record.E_EMPTY)
+                    continue
+                fields.append(field_class(tag, data=content))
+                continue
+
+            if indicators is None:
+                indicators = (' ', ' ')
+            elif len(indicators) != 2:
+                raise ValueError(Record.E_INVALID_INDICATOR)
+            if isinstance(content, str):
+                raise ValueError(Record.E_NO_DATA)
+            subfields = []
+            for code, value in content:
+                if not isinstance(value, str):
+                    raise ValueError('subfield values must be strings')
+                if value:
+                    subfields.append(make_subfield((code, value)))
+            if not subfields:
+                if self.strict:
+                    raise ValueError('none of the subfields contains a value')
+                continue
+            fields.append(field_class(tag, tuple(indicators), subfields))
+        self.add_field(*fields)
+
+    @classmethod
+    def from_fields(cls, rows, leader=None, trusted=False, **kwargs):
+        """
+        Create a record from field tuples, see `add_many`. Keyword arguments
+        are passed to the constructor, e.g. `compact=True`.
+
+        >>> record = Record.from_fields([('001', None, '123'),
+        ...                              ('245', '10', [('a', 'Title')])])
+        """
+        if leader is not None:
+            kwargs['leader'] = leader
+        record = cls(**kwargs)
+        record.add_many(rows, trusted=trusted)
+        return record
+
+    def remove(self, *fieldspecs):
+        """
+        Removes fields or subfields according to `fieldspecs`, e.g.
+
+            record.remove('001', '020.z', '912')
+
+        If a non-control field subfield removal leaves no other subfields,
+        delete the field entirely. All specs are applied in a single pass
+        over the fields.
+        """
+        table = _subfield_table(fieldspecs)
+        if not table:
+            return None
+
+        kept = []
+        for field in self.fields:
+            if field.tag not in table:
+                kept.append(field)
+                continue
+            codes = table[field.tag]
+            if codes is None:
+                continue
+            if not any(code in field for code in codes):
+                kept.append(field)
+                continue
+            subfields = [sf for sf in field.subfields if sf.code not in codes]
+            # if we removed the last subfield entry,
+            # remove the whole field, too
+            if subfields:
+                field.subfields = subfields
+                kept.append(field)
+        if len(kept) != len(self.fields):
+            self.fields[:] = kept
+            self._tagindex = None
+
+    def firstvalue(self, *fieldspecs, **kwargs):
+        """
+        Return the [first] [v]alue or the value given by the keyword
+        argument `default` if not value exists. `default` defaults to `None`.
+        """
+        default = kwargs.get('default', None)
+        return next(self.itervalues(*fieldspecs, **kwargs), default)
+
+    def itervalues(self, *fieldspecs, **kwargs):
+        """
+        Apply valuegetter on self.
+        Shortcut for `valuegetter(*fieldspecs)(self)`
+        """
+        return valuegetter(*fieldspecs, **kwargs)(self)
+
+    def values(self, *fieldspecs, **kwargs):
+        """
+        Turn generator from itervalues into list.
+        """
+        return list(self.itervalues(*fieldspecs, **kwargs))
+
+    def iterfields(self, *fieldspecs):
+        """
+        Shortcut for `fieldgetter(*fieldspecs)(self)`; we do not add fields
+        methods, since that attribute is used already by pymarc.Record.
+        """
+        return fieldgetter(*fieldspecs)(self)
+
+    def contains(self, *fieldspecs, **kwargs):
+        """
+        Quickly check, if a field contains a given value.
+        """
+        raise NotImplementedError
+
+    def remove_field_if(self, *args):
+        """
+        Remove a field from this record, if
+        `fun(value)` evaluates to `True`.
+
+        The real signature is like:
+
+            remove_field_if(self, fieldspec, fun):
+
+        but a variable number of fieldspecs can be added,
+        so we have to resort to `*args` and figure out, which one is
+        a function, by asking if the argument is `callable`.
+
+        Example:
+
+        Iterate over all 710.a fields and remove the
+        field, if any subfield value startswith
+        'Naxos Digital Services.'
+
+        Returns a list of removed fields (or an empty list).
+
+        >>> _ = record.remove_field_if('710.a',
+            _startswith('Naxos Digital Services.'))
+
+        If there are multiple fields with the same tag,
+        only the fields that match are removed, e.g.:
+
+        >>> record = Record()
+        >>> record.add('020', a='97811111111')
+        >>> record.add('020', a='11111111')
+        >>> rmvd = record.remove_field_if('020.a', _startswith('978'))
+        >>> print(rmvd)
+        [<pymarc.field.Field object at 0x1e53910>]
+
+        >>> print(record)
+        =LDR            22        4500
+        =020  \\$a11111111
+
+        Instead of fieldspecs and a single function, a mapping from
+        fieldspecs to functions can be passed, to apply a whole rule set
+        in one go:
+
+        >>> rmvd = record.remove_field_if({
+        ...     '020.a': _startswith('978'),
+        ...     '912.a': _equals('ZDB-1-X'),
+        ... })
+
+        Each field is removed (and returned) at most once, the fields list
+        is rebuilt once.
+        """
+        if len(args) == 1 and isinstance(args[0], Mapping):
+            rules = args[0].items()
+        else:
+            fieldspecs, function = _split_test_args(args, lambda val: False)
+            rules = [(spec, function) for spec in fieldspecs]
+        table = {}
+        for spec, function in rules:
+            if not callable(function):
+                raise ValueError('rule for %s is not callable' % spec)
+            spec = fieldspec(spec)
+            if spec is not None:
+                table.setdefault(spec.tag, []).append((spec, function))
+
+        removed, kept = [], []
+        for field in self.fields:
+            for spec, function in table.get(field.tag, ()):
+                if any(function(value) for value in spec.values(field)):
+                    removed.append(field)
+                    break
+            else:
+                kept.append(field)
+        if removed:
+            self.fields[:] = kept
+            self._tagindex = None
+        return removed
+
+    def test(self, *args, **kwargs):
+        """
+        Test whether the function evaluated on the fields given in `args`
+        returns `True`.
+
+        >>> record.add('020.a', a='0387310738', z='1234')
+        >>> def _is_valid_isbn(value):
+        ...     ''' poor man's isbn validator '''
+        ...     return len(value) in (10, 13)
+        >>> record.test('020.a', '020.z', _is_valid_isbn)
+        True
+
+        If `all` is set to `True`, the test only
+        returns `True`, if all values pass the given check, e.g.:
+
+        >>> record.test('020.a', '020.z', _is_valid_isbn, all=True)
+        False
+
+        means that for each field and every value the ISBN check
+        is performed. Defaults to `False`.
+
+        Values are evaluated lazily, in both modes the test stops as soon
+        as the result is known. A record without any matching values does
+        not pass the test.
+
+        @see also: `test_many`
+        """
+        fieldspecs, function = _split_test_args(args, lambda val: True)
+        return _test_values(valuegetter(*fieldspecs)(self), function,
+                            kwargs.get('all', False))
+
+    def matches(self, expr):
+        """
+        Return `True`, if the record matches the query `expr`, e.g.
+
+        >>> record.matches('020.a ^= "978" and not 912.a = "ZDB-1-X"')
+        True
+
+        @see also: `query`
+        """
+        return query(expr)(self)
+
+    def has(self, fieldspec):
+        """
+        Return `True` is the record has any value in the specified fieldspec.
+        """
+        return self.has_any(fieldspec)
+
+    def has_any(self, *fieldspecs):
+        """
+        Return `True`, if the record has a value in any of the given
+        fieldspecs. Checks all specs in a single pass over the fields.
+        """
+        table = _fieldspec_table(fieldspecs)
+        if not table:
+            return False
+        for field in self._read_fields(*table):
+            for spec in table[field.tag]:
+                if spec.occurs_in(field):
+                    return True
+        return False
+
+    def has_all(self, *fieldspecs):
+        """
+        Return `True`, if the record has a value in each of the given
+        fieldspecs. Checks all specs in a single pass over the fields.
+        """
+        table = _fieldspec_table(fieldspecs)
+        if not table:
+            return True
+        missing = set(spec for specs in table.values() for spec in specs)
+        for field in self._read_fields(*table):
+            for spec in table[field.tag]:
+                if spec in missing and spec.occurs_in(field):
+                    missing.discard(spec)
+                    if not missing:
+                        return True
+        return False
+
+    def iterflat(self, include=None, exclude=None, indicators=True):
+        """
+        Yield all stripped, non-empty values of this record (from all fields,
+        except the leader), in field order, including indicators.
+
+        `include` and `exclude` take fieldspecs to restrict the values to
+        certain fields or subfields, e.g. `include=('245', '650.a')` or
+        `exclude=('005', '935')`. Indicators are only yielded for fields
+        included as a whole and can be turned off with `indicators=False`.
+        """
+        if isinstance(include, str):
+            include = (include,)
+        if isinstance(exclude, str):
+            exclude = (exclude,)
+        included = _subfield_table(tuple(include)) if include else None
+        excluded = _subfield_table(tuple(exclude)) if exclude else {}
+        for field in self._read_fields():
+            codes = None
+            if included is not None:
+                if field.tag not in included:
+                    continue
+                codes = included[field.tag]
+            skipped = excluded.get(field.tag, ())
+            if skipped is None:
+                continue
+            if field.control_field:
+                if codes is None:
+                    value = (field.data or '').strip()
+                    if value:
+                        yield value
+                continue
+            if indicators and codes is None:
+                for value in field.indicators:
+                    value = value.strip()
+                    if value:
+                        yield value
+            for subfield in field.subfields:
+                if codes is not None and subfield.code not in codes:
+                    continue
+                if subfield.code in skipped:
+                    continue
+                value = subfield.value.strip()
+                if value:
+                    yield value
+
+    def flatten(self, **kwargs):
+        """
+        Flatten this record to a simple list of values
+        (from all fields, except the leader). Takes the same keyword
+        arguments as `iterflat`.
+        """
+        return list(self.iterflat(**kwargs))
+
+    def fingerprint(self, exclude=('005',)):
+        """
+        Return a stable hash (32 hex digits) of the leader, tags, indicators
+        and subfields of this record. Fields and subfields matched by the
+        fieldspecs in `exclude` do not count, by default the time of the
+        latest transaction (005). Record length and base address of the
+        leader are ignored, so the fingerprint does not depend on how the
+        record was read or serialized.
+
+        >>> record.fingerprint()
+        '5c1bd54a3e1b4a02d3bb5c7e6e5d3f87'
+        >>> record.fingerprint(exclude=('005', '935.a'))
+        """
+        if isinstance(exclude, str):
+            exclude = (exclude,)
+        excluded = _subfield_table(tuple(exclude)) if exclude else {}
+        leader = str(self.leader)
+        parts = [leader[5:12], leader[17:]]
+        for field in self._read_fields():
+            codes = excluded.get(field.tag, ())
+            if codes is None:
+                continue
+            if field.control_field:
+                parts.append('\x1e%s\x1f%s' % (field.tag, field.data))
+                continue
+            parts.append('\x1e%s%s%s' % ((field.tag,) + tuple(field.indicators)))
+            for code, value in field.subfields:
+                if code not in codes:
+                    parts.append('\x1f%s%s' % (code, value))
+        return hashlib.blake2b(''.join(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+FatRecord = Record
+
+
+def flatten(struct):
+    """Cleates a flat list of all items in structured output (dicts, lists, items)
+    Examples:
+    > _flatten({'a': foo, b: bar})
+    [foo, bar]
+    > _flatten([foo, [bar, troll]])
+    [foo, bar, troll]
+    > _flatten(foo)
+    [foo]
+    """
+    if struct is None:
+        return []
+    flat = []
+    if isinstance(struct, dict):
+        for key, result in struct.items():
+            flat += flatten(result)
+        return flat
+
+    if isinstance(struct, str):
+        return [struct]
+
+    try:
+        # if iterable
+        for result in struct:
+            flat += flatten(result)
+        return flat
+    except TypeError:
+        pass
+
+    return [struct]
+
+
+class ListColumn(object):
+    """
+    A column of multi-valued cells: all values are kept in a flat list, the
+    values of row `i` are `values[offsets[i]:offsets[i + 1]]`.
+    """
+    __slots__ = ('values', 'offsets')
+
+    def __init__(self):
+        self.values = []
+        self.offsets = array.array('q', [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return 'ListColumn(%r)' % list(self)
+
+    def append(self, values):
+        """
+        Add a row with the given values.
+        """
+        self.values.extend(values)
+        self.offsets.append(len(self.values))
+
+
+_EXTRACT_MODES = ('list', 'first', 'join')
+
+
+def _extract_columns(specs):
+    """
+    Turn a name -> fieldspec(s) mapping into a list of (name, getter) tuples.
+    """
+    columns = []
+    for name, spec in specs.items():
+        if isinstance(spec, (str, FieldSpec)):
+            spec = (spec,)
+        columns.append((name, valuegetter(*spec)))
+    return columns
+
+
+def _extract_batch(records, columns, multi, sep):
+    batch = {}
+    for name, getter in columns:
+        if multi == 'list':
+            column = ListColumn()
+            for record in records:
+                column.append(getter(record))
+        elif multi == 'first':
+            column = [next(getter(record), None) for record in records]
+        else:
+            column = [sep.join(getter(record)) or None for record in records]
+        batch[name] = column
+    return batch
+
+
+def iterextract(records, specs, multi='list', sep='; ', batch_size=10000):
+    """
+    Extract values from `records` into columns, in batches of `batch_size`
+    records. `specs` maps column names to a fieldspec or a tuple of
+    fieldspecs. Yields dictionaries mapping column names to columns.
+
+    How multiple values per record are handled depends on `multi`:
+
+    * `list`: columns are `ListColumn` objects, with all values per row,
+    * `first`: columns are lists with the first value per row or `None`,
+    * `join`: columns are lists with all values per row joined by `sep` or `None`.
+
+    >>> for batch in iterextract(records, {'id': '001', 'isbn': ('020.a', '020.z')}):
+    ...     print(batch['id'][0], batch['isbn'][0])
+    """
+    if multi not in _EXTRACT_MODES:
+        raise ValueError('multi must be one of %s' % ', '.join(_EXTRACT_MODES))
+    columns = _extract_columns(specs)
+    for chunk in _chunked(records, batch_size):
+        yield _extract_batch(chunk, columns, multi, sep)
+
+
+def extract(records, specs, multi='list', sep='; '):
+    """
+    Like `iterextract`, but returns a single batch with all records.
+
+    >>> columns = extract(records, {'id': '001', 'title': '245.a'}, multi='first')
+    >>> columns['title']
+    ['The pragmatic programmer :', ...]
+    """
+    for batch in iterextract(records, specs, multi=multi, sep=sep, batch_size=None):
+        return batch
+    return _extract_batch([], _extract_columns(specs), multi, sep)
+
+
+def write_corpus(records, target, sep=' ', **kwargs):
+    """
+    Write the flattened values of each record as one line of text to
+    `target`, a path or a text file object. Records without values are
+    skipped. Keyword arguments are passed to `Record.iterflat`, e.g.
+    `indicators=False`. Returns the number of lines written.
+
+    >>> write_corpus(iter_lazy('dump.mrc'), 'corpus.txt', exclude=('005', '008'))
+    """
+    if hasattr(target, 'write'):
+        handle = target
+    else:
+        handle = open(target, 'w', encoding='utf-8')
+    lines = 0
+    try:
+        for record in records:
+            line = sep.join(record.iterflat(**kwargs))
+            if not line:
+                continue
+            handle.write(line.replace('\n', ' ').replace('\r', ' '))
+            handle.write('\n')
+            lines += 1
+    finally:
+        if handle is not target:
+            handle.close()
+    return lines
+
+
+def _iter_raw_records(fileobj):
+    """
+    Split a MARC21 stream into records, using the record length from the
+    first five bytes of each leader. Yields (offset, data) tuples, where
+    `offset` is the byte offset of the record in the stream.
+    """
+    offset = 0
+    while True:
+        head = fileobj.read(5)
+        if not head:
+            return
+        if len(head) < 5 or not head.isdigit() or int(head) < 5:
+            raise pymarc.exceptions.RecordLengthInvalid
+        length = int(head)
+        rest = fileobj.read(length - 5)
+        if len(rest) < length - 5:
+            raise pymarc.exceptions.TruncatedRecord
+        yield offset, head + rest
+        offset += length
+
+
+def _chunked(iterable, size):
+    """
+    s -> [s0, ..., s(size-1)], [s(size), ...], ...
+    """
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _bounded_map(executor, function, tasks, backlog, ordered=True):
+    """
+    Like `executor.map`, but submits at most `backlog` tasks ahead of the
+    consumer and yields results as they complete, if not `ordered`.
+    """
+    import concurrent.futures
+    pending = collections.deque()
+
+    def drain(limit):
+        while len(pending) > limit:
+            if ordered:
+                yield pending.popleft().result()
+            else:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield future.result()
+
+    try:
+        for task in tasks:
+            pending.append(executor.submit(function, *task))
+            for result in drain(backlog - 1):
+                yield result
+        for result in drain(0):
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _process_chunk(function, chunk, kwargs):
+    """
+    Worker side of `process`: parse raw records and apply `function`.
+    """
+    return [function(Record(data=data, **kwargs)) for data in chunk]
+
+
+def process(path, function, workers=None, chunk_records=1000, ordered=True,
+            **kwargs):
+    """
+    Apply `function` to every record in the MARC21 file at `path` (or a
+    binary file object) on a process pool and yield the results.
+
+    The file is split into chunks of `chunk_records` raw records in the
+    calling process; records are parsed into `Record` objects and passed to
+    `function` in the workers. Results come back in input order, unless
+    `ordered` is `False`. Additional keyword arguments are passed to the
+    `Record` constructor, e.g. `force_utf8=True`.
+
+    `workers` defaults to the number of CPUs; with `workers=1` everything
+    runs in the calling process. `function` and its results must be
+    picklable, so use module level functions, not lambdas.
+
+    >>> from operator import methodcaller
+    >>> ids = list(process('dump.mrc', methodcaller('firstvalue', '001')))
+    """
+    if hasattr(path, 'read'):
+        handle = path
+    else:
+        handle = open(path, 'rb')
+    try:
+        chunks = _chunked((data for _, data in _iter_raw_records(handle)),
+                          chunk_records)
+        tasks = ((function, chunk, kwargs) for chunk in chunks)
+        for results in _map_chunks(_process_chunk, tasks, workers, ordered):
+            for result in results:
+                yield result
+    finally:
+        if handle is not path:
+            handle.close()
+
+
+def _map_chunks(worker, tasks, workers=None, ordered=True):
+    """
+    Yield `worker(*task)` for each task on a process pool of `workers`
+    processes (number of CPUs by default), in the calling process for
+    `workers=1`.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        for task in tasks:
+            yield worker(*task)
+        return
+    import concurrent.futures
+    executor = concurrent.futures.ProcessPoolExecutor(workers)
+    try:
+        for result in _bounded_map(executor, worker, tasks, 2 * workers,
+                                   ordered=ordered):
+            yield result
+    finally:
+        executor.shutdown(wait=True)
+
+
+def _decode_field(tag, data, utf8=True, hide_utf8_warnings=False,
+                  utf8_handling='strict'):
+    """
+    Decode the bytes of a single field, the same way
+    `pymarc.Record.decode_marc` does.
+    """
+    if tag < '010' and tag.isdigit():
+        return pymarc.Field(tag=tag, data=data.decode('utf-8' if utf8 else 'iso8859-1'))
+    subs = data.split(b'\x1f')
+    indicators = subs[0].decode('ascii')
+    if not indicators:
+        indicators = '  '
+    elif len(indicators) == 1:
+        indicators += ' '
+    subfields = []
+    for subfield in subs[1:]:
+        if not subfield:
+            continue
+        skip_bytes = 1
+        try:
+            code = subfield[0:1].decode('ascii')
+        except UnicodeDecodeError:
+            warnings.warn(pymarc.exceptions.BadSubfieldCodeWarning(subfield),
+                          stacklevel=2)
+            code, skip_bytes = pymarc.record.normalize_subfield_code(subfield)
+        value = subfield[skip_bytes:]
+        if utf8:
+            value = value.decode('utf-8', utf8_handling)
+        else:
+            value = pymarc.marc8_to_unicode(value, hide_utf8_warnings)
+        subfields.append(pymarc.Subfield(code, value))
+    return pymarc.Field(tag=tag,
+                        indicators=pymarc.Indicators(indicators[0], indicators[1]),
+                        subfields=subfields)
+
+
+def _control_field(field_class, tag, data):
+    """
+    Return a control field with `tag` and `data`. pymarc only takes numeric
+    tags below 010 for control fields, others are turned into one here.
+    """
+    field = field_class(tag, data=data)
+    if not field.control_field:
+        field.control_field = True
+        field.data = data
+        field._indicators = None
+    return field
+
+
+def _materializing(name):
+    """
+    Wrap a `Record` method, so that it turns a `LazyRecord` into a `Record`
+    before running.
+    """
+    def method(self, *args, **kwargs):
+        self.materialize()
+        return getattr(self, name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(Record, name).__doc__
+    return method
+
+
+_FIELDS_SLOT = pymarc.Record.fields
+
+
+class LazyRecord(Record):
+    """
+    A record backed by the raw MARC21 bytes in `buf`, usually an `mmap` of a
+    file (see `iter_lazy`). Only the leader and the directory are parsed
+    up front, fields are decoded on first access to their tag.
+
+    Supports the query methods of `Record` (`itervalues`, `iterfields`,
+    `firstvalue`, `test`, `has`, ...). Any modification, as well as access
+    to the `fields` list, decodes all fields and turns the object into a
+    plain `Record`. Once a field has been handed out (by `get_fields`,
+    `get`, `[]`, `iterfields` or iteration) or the leader has changed,
+    `as_marc` encodes the decoded fields instead of returning the original
+    bytes, so fields edited in place are not lost.
+    """
+
+    def __init__(self, buf, offset=0, length=None, force_utf8=False,
+                 hide_utf8_warnings=False, utf8_handling='strict'):
+        if length is None:
+            length = int(buf[offset:offset + 5])
+        leader = buf[offset:offset + 24].decode('ascii')
+        if len(leader) != 24:
+            raise pymarc.exceptions.RecordLeaderInvalid
+        base_address = int(leader[12:17])
+        if base_address <= 0:
+            raise pymarc.exceptions.BaseAddressNotFound
+        if base_address >= length:
+            raise pymarc.exceptions.BaseAddressInvalid
+        directory = buf[offset + 24:offset + base_address - 1].decode('ascii')
+        if len(directory) % 12 != 0:
+            raise pymarc.exceptions.RecordDirectoryInvalid
+
+        self.leader = pymarc.Leader(leader)
+        self.pos = 0
+        self.force_utf8 = force_utf8
+        self.to_unicode = True
+        self.strict = True
+        self.offset = offset
+        self.length = length
+        self._buf = buf
+        self._start = offset + base_address
+        self._entries = [(directory[i:i + 3],
+                          int(directory[i + 3:i + 7]),
+                          int(directory[i + 7:i + 12]))
+                         for i in range(0, len(directory), 12)]
+        self._decoded = [None] * len(self._entries)
+        self._positions = None
+        self._leader = leader
+        self._exposed = False
+        self._decode_options = (leader[9] == 'a' or force_utf8,
+                                hide_utf8_warnings, utf8_handling)
+
+    @property
+    def fields(self):
+        self.materialize()
+        return _FIELDS_SLOT.__get__(self)
+
+    @fields.setter
+    def fields(self, value):
+        self.materialize()
+        _FIELDS_SLOT.__set__(self, value)
+
+    def materialize(self):
+        """
+        Decode all fields and turn this object into a `Record`. Returns
+        the record itself.
+        """
+        if self.__class__ is not LazyRecord:
+            return self
+        fields = self._read_fields()
+        for name in ('offset', 'length', '_buf', '_start', '_entries',
+                     '_decoded', '_positions', '_leader', '_exposed',
+                     '_decode_options'):
+            delattr(self, name)
+        self.__class__ = Record
+        _FIELDS_SLOT.__set__(self, fields)
+        return self
+
+    def _field(self, i):
+        field = self._decoded[i]
+        if field is None:
+            tag, length, offset = self._entries[i]
+            start = self._start + offset
+            field = self._decoded[i] = _decode_field(
+                tag, self._buf[start:start + length - 1], *self._decode_options)
+        return field
+
+    def _tag_positions(self):
+        if self._positions is None:
+            positions = {}
+            for i, entry in enumerate(self._entries):
+                positions.setdefault(entry[0], []).append(i)
+            self._positions = positions
+        return self._positions
+
+    def _read_fields(self, *args):
+        if not args:
+            return [self._field(i) for i in range(len(self._entries))]
+        positions = self._tag_positions()
+        if len(args) == 1:
+            found = positions.get(args[0], ())
+        else:
+            found = sorted(i for tag in set(args) for i in positions.get(tag, ()))
+        return [self._field(i) for i in found]
+
+    def get_fields(self, *args):
+        """
+        Return the fields with the given tags (or all fields), decoding
+        them as needed.
+        """
+        self._exposed = True
+        return self._read_fields(*args)
+
+    def get(self, tag, default=None):
+        found = self._tag_positions().get(tag)
+        if not found:
+            return default
+        self._exposed = True
+        return self._field(found[0])
+
+    def __getitem__(self, tag):
+        found = self._tag_positions().get(tag)
+        if not found:
+            raise KeyError
+        self._exposed = True
+        return self._field(found[0])
+
+    def __contains__(self, tag):
+        return tag in self._tag_positions()
+
+    def __iter__(self):
+        return iter(self.get_fields())
+
+    def __str__(self):
+        return '\n'.join(['=LDR  %s' % self.leader] +
+                         [str(field) for field in self._read_fields()]) + '\n'
+
+    def as_marc(self):
+        """
+        Return the original bytes of an unchanged UTF-8 record, otherwise
+        decode the record and re-encode it as UTF-8, like `Record.as_marc`.
+        """
+        if (self._decode_options[0] and not self._exposed and
+                str(self.leader) == self._leader):
+            return self._buf[self.offset:self.offset + self.length]
+        return self.materialize().as_marc()
+
+    as_marc21 = as_marc
+
+    def invalidate_index(self):
+        pass
+
+    add = _materializing('add')
+    add_field = _materializing('add_field')
+    add_grouped_field = _materializing('add_grouped_field')
+    add_ordered_field = _materializing('add_ordered_field')
+    remove = _materializing('remove')
+    remove_field = _materializing('remove_field')
+    remove_fields = _materializing('remove_fields')
+    remove_field_if = _materializing('remove_field_if')
+    add_many = _materializing('add_many')
+
+
+def iter_lazy(path, **kwargs):
+    """
+    Yield a `LazyRecord` for each record in the MARC21 file at `path`. The
+    file is memory-mapped, so scanning only touches the bytes of leaders,
+    directories and the fields actually looked at. Keyword arguments are
+    passed to `LazyRecord`.
+
+    >>> ids = [record.firstvalue('001') for record in iter_lazy('dump.mrc')]
+    """
+    with open(path, 'rb') as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return
+        buf = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    offset, size = 0, len(buf)
+    while offset < size:
+        head = buf[offset:offset + 5]
+        if len(head) < 5 or not head.isdigit() or int(head) < 5:
+            raise pymarc.exceptions.RecordLengthInvalid
+        length = int(head)
+        if offset + length > size:
+            raise pymarc.exceptions.TruncatedRecord
+        yield LazyRecord(buf, offset, length, **kwargs)
+        offset += length
+
+
+def build_index(path, key='001', index_path=None):
+    """
+    Write a sidecar index for the MARC21 file at `path`, which maps the
+    first value of fieldspec `key` of each record to the byte offset and
+    length of the record. The index is a sqlite3 database, stored at
+    `index_path` or `path` + `.idx`. Records without a key are skipped, for
+    duplicate keys the last record wins. The index is out of date, once
+    size or modification time of the file change. Returns the path of the
+    index.
+
+    >>> build_index('dump.mrc')
+    'dump.mrc.idx'
+    """
+    import sqlite3
+    if index_path is None:
+        index_path = path + '.idx'
+    tmp_path = index_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    # Taken before reading, so changes during the scan make the index stale.
+    stat = os.stat(path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)')
+        conn.execute('CREATE TABLE records (key TEXT PRIMARY KEY, '
+                     'offset INTEGER, length INTEGER) WITHOUT ROWID')
+        rows = ((record.firstvalue(key), record.offset, record.length)
+                for record in iter_lazy(path))
+        conn.executemany('INSERT OR REPLACE INTO records VALUES (?, ?, ?)',
+                         (row for row in rows if row[0] is not None))
+        conn.executemany('INSERT INTO meta VALUES (?, ?)',
+                         [('key', key), ('size', str(stat.st_size)),
+                          ('mtime_ns', str(stat.st_mtime_ns))])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+class IndexedFile(object):
+    """
+    Random access to the records of a MARC21 file by key, through the
+    sidecar index written by `build_index`. Keyword arguments are passed
+    to the `Record` constructor.
+
+    >>> with IndexedFile('dump.mrc') as records:
+    ...     record = records.get('010000011')
+    ...     for key, record in records.get_many(['010000011', '010000038']):
+    ...         print(key, record.title)
+    """
+
+    # Maximum number of keys per query in `get_many`.
+    batch_size = 500
+
+    def __init__(self, path, index_path=None, **kwargs):
+        import sqlite3
+        if index_path is None:
+            index_path = path + '.idx'
+        if not os.path.exists(index_path):
+            raise IOError('no index found at %s, see build_index' % index_path)
+        self.path = path
+        self.index_path = index_path
+        self.kwargs = kwargs
+        self._conn = sqlite3.connect(index_path)
+        meta = dict(self._conn.execute('SELECT name, value FROM meta'))
+        stat = os.stat(path)
+        if (meta['size'] != str(stat.st_size) or
+                meta.get('mtime_ns') != str(stat.st_mtime_ns)):
+            self._conn.close()
+            raise ValueError('index %s is out of date' % index_path)
+        self.key = meta['key']
+        self._handle = open(path, 'rb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+        self._handle.close()
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def __contains__(self, key):
+        return self.locate(key) is not None
+
+    def locate(self, key):
+        """
+        Return the (offset, length) of the record with `key` or `None`.
+        """
+        return self._conn.execute('SELECT offset, length FROM records '
+                                  'WHERE key = ?', (key,)).fetchone()
+
+    def _read(self, offset, length):
+        self._handle.seek(offset)
+        return Record(data=self._handle.read(length), **self.kwargs)
+
+    def get(self, key, default=None):
+        """
+        Return the record with `key` or `default`.
+        """
+        location = self.locate(key)
+        if location is None:
+            return default
+        return self._read(*location)
+
+    def get_many(self, keys):
+        """
+        Yield (key, record) tuples for all of `keys` found in the index.
+        Records are read in file order, not in the order of `keys`.
+        """
+        for key, offset, length in self.locate_many(keys):
+            yield key, self._read(offset, length)
+
+    def locate_many(self, keys):
+        """
+        Return a list of (key, offset, length) tuples for all of `keys`
+        found in the index, in file order.
+        """
+        locations = []
+        for batch in _chunked(set(keys), self.batch_size):
+            query = ('SELECT key, offset, length FROM records WHERE key IN (%s)' %
+                     ', '.join('?' * len(batch)))
+            locations.extend(self._conn.execute(query, batch))
+        return sorted(locations, key=operator.itemgetter(1))
+
+
+def _copy_range(source, target, start, stop, block_size=1 << 20):
+    """
+    Copy the bytes from `start` to `stop` of file object `source` to
+    `target` in blocks of `block_size` bytes.
+    """
+    source.seek(start)
+    remaining = stop - start
+    while remaining > 0:
+        block = source.read(min(block_size, remaining))
+        if not block:
+            raise pymarc.exceptions.TruncatedRecord
+        target.write(block)
+        remaining -= len(block)
+
+
+def apply_delta(base, delta, out, key='001', index_path=None, **kwargs):
+    """
+    Write the MARC21 file `base` with the records of the MARC21 file `delta`
+    applied to `out` (a path or a binary file object). Delta records replace
+    base records with the same key (001 by default) in place, records
+    marked as deleted (leader position 5 is `d`) are dropped, all other
+    delta records are appended. For repeated keys in the delta, the last
+    record wins.
+
+    Uses the index of `base` (see `build_index`), which is built, if it is
+    missing or out of date. Only delta records are decoded and re-encoded
+    (keyword arguments go to the `Record` constructor); everything between
+    them is copied from `base` as is, in large blocks. Returns a dictionary
+    with the number of `replaced`, `deleted` and `added` records.
+
+    >>> apply_delta('dump.mrc', 'updates.mrc', 'merged.mrc')
+    {'replaced': 1200, 'deleted': 15, 'added': 430}
+    """
+    if hasattr(delta, 'read'):
+        handle = delta
+    else:
+        handle = open(delta, 'rb')
+    try:
+        changes = collections.OrderedDict()
+        for _, data in _iter_raw_records(handle):
+            record = LazyRecord(data)
+            value = record.firstvalue(key)
+            if value is None:
+                continue
+            changes.pop(value, None)
+            changes[value] = None if record.leader[5] == 'd' else data
+    finally:
+        if handle is not delta:
+            handle.close()
+
+    try:
+        indexed = IndexedFile(base, index_path=index_path)
+    except (IOError, ValueError):
+        build_index(base, key=key, index_path=index_path)
+        indexed = IndexedFile(base, index_path=index_path)
+    with indexed:
+        if indexed.key != key:
+            raise ValueError('index %s is keyed by %s, not %s' % (
+                indexed.index_path, indexed.key, key))
+        locations = indexed.locate_many(changes)
+    stats = {'replaced': 0, 'deleted': 0, 'added': 0}
+
+    if hasattr(out, 'write'):
+        target = out
+    else:
+        target = open(out, 'wb')
+    try:
+        with open(base, 'rb') as source:
+            position = 0
+            for value, offset, length in locations:
+                _copy_range(source, target, position, offset)
+                position = offset + length
+                data = changes.pop(value)
+                if data is None:
+                    stats['deleted'] += 1
+                else:
+                    target.write(Record(data=data, **kwargs).as_marc())
+                    stats['replaced'] += 1
+            _copy_range(source, target, position, os.path.getsize(base))
+        for data in changes.values():
+            if data is not None:
+                target.write(Record(data=data, **kwargs).as_marc())
+                stats['added'] += 1
+    finally:
+        if target is not out:
+            target.close()
+    return stats
+
+
+def _group_keys(columns, normalize, record):
+    """
+    Yield the normalized keys of a record, one (column number, key) tuple
+    per distinct key.
+    """
+    seen = set()
+    for i, getter in enumerate(columns):
+        for value in getter(record):
+            key = normalize(value)
+            if key and (i, key) not in seen:
+                seen.add((i, key))
+                yield i, key
+
+
+def group_by(records, keyspecs, normalize=None, min_size=1, keep_records=False,
+             tmpdir=None, batch_size=10000):
+    """
+    Group records, which share at least one key, into clusters; clusters are
+    transitive, if A and B share an ISBN and B and C an OCLC number, all
+    three end up in one cluster. Each record belongs to exactly one cluster.
+
+    `keyspecs` is a list of fieldspecs or tuples of fieldspecs; values from
+    specs in one tuple are compared with each other, e.g. ISBN from `020.a`,
+    `020.z` and `776.z`. Values are passed through `normalize` (strip
+    whitespace by default), which may return `None` to drop a value.
+
+    Keys and cluster labels are kept in a temporary sqlite3 database in
+    `tmpdir`, so memory use stays flat for any number of records. Yields
+    clusters of at least `min_size` records as lists, either of the
+    positions of the records in `records` - or their `offset`, if they come
+    from `iter_lazy` - or, with `keep_records`, of the records themselves.
+
+    >>> for cluster in group_by(iter_lazy('dump.mrc'), [('020.a', '020.z', '776.z'), '035.a'],
+    ...                         min_size=2):
+    ...     print(cluster)
+    [10233, 9918732]
+    """
+    import sqlite3
+    import tempfile
+
+    if normalize is None:
+        normalize = str.strip
+    columns = [getter for _, getter in _extract_columns(dict(enumerate(keyspecs)))]
+    handle, path = tempfile.mkstemp(suffix='.sqlite', dir=tmpdir)
+    os.close(handle)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('CREATE TABLE keys (key TEXT, id INTEGER)')
+        conn.execute('CREATE TABLE labels (id INTEGER PRIMARY KEY, label INTEGER, '
+                     'handle INTEGER, data BLOB)')
+        for batch in _chunked(enumerate(records), batch_size):
+            conn.executemany('INSERT INTO keys VALUES (?, ?)', (
+                ('%d:%s' % key, i) for i, record in batch
+                for key in _group_keys(columns, normalize, record)))
+            conn.executemany('INSERT INTO labels VALUES (?, ?, ?, ?)', (
+                (i, i, getattr(record, 'offset', i),
+                 record.as_marc() if keep_records else None)
+                for i, record in batch))
+        conn.execute('CREATE INDEX keys_key ON keys (key, id)')
+
+        # Propagate the smallest label through shared keys, until labels
+        # settle; takes as many rounds as the longest chain of records.
+        while True:
+            conn.execute('CREATE TEMP TABLE candidates (id INTEGER PRIMARY KEY, label INTEGER)')
+            conn.execute("""
+                INSERT INTO candidates
+                SELECT k.id, MIN(m.label) FROM keys k JOIN (
+                    SELECT k.key, MIN(l.label) AS label FROM keys k
+                    JOIN labels l ON l.id = k.id GROUP BY k.key) m ON m.key = k.key
+                GROUP BY k.id""")
+            changed = conn.execute("""
+                UPDATE labels SET label = (
+                    SELECT c.label FROM candidates c WHERE c.id = labels.id)
+                WHERE label > (SELECT c.label FROM candidates c WHERE c.id = labels.id)
+                """).rowcount
+            conn.execute('DROP TABLE candidates')
+            if not changed:
+                break
+        conn.execute('CREATE INDEX labels_label ON labels (label, id)')
+
+        rows = conn.execute('SELECT label, handle, data FROM labels ORDER BY label, id')
+        for _, group in itertools.groupby(rows, key=operator.itemgetter(0)):
+            group = list(group)
+            if len(group) < min_size:
+                continue
+            if keep_records:
+                yield [Record(data=data) for _, _, data in group]
+            else:
+                yield [handle for _, handle, _ in group]
+    finally:
+        conn.close()
+        os.remove(path)
+
+
+class ChangeLog(object):
+    """
+    Fingerprints of records by key (001), stored in a sqlite3 database at
+    `path`, to find out which records of a stream are new or changed and
+    which have been deleted since the last run.
+
+    >>> with ChangeLog('fingerprints.db') as log:
+    ...     for status, key, record in log.update(iter_lazy('dump.mrc')):
+    ...         print(status, key)
+    new 010000011
+    changed 010000038
+    deleted 010000046
+
+    See `Record.fingerprint` for `exclude`. Records without a key are
+    skipped.
+    """
+
+    NEW, CHANGED, DELETED = 'new', 'changed', 'deleted'
+
+    # Maximum number of keys per query.
+    batch_size = 500
+
+    def __init__(self, path, key='001', exclude=('005',)):
+        import sqlite3
+        self.path = path
+        self.key = key
+        self.exclude = exclude
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS fingerprints '
+                           '(key TEXT PRIMARY KEY, fingerprint TEXT) WITHOUT ROWID')
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM fingerprints').fetchone()[0]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key):
+        """
+        Return the stored fingerprint for `key` or `None`.
+        """
+        row = self._conn.execute('SELECT fingerprint FROM fingerprints WHERE key = ?',
+                                 (key,)).fetchone()
+        return row[0] if row else None
+
+    def update(self, records, unchanged=False, commit=True):
+        """
+        Compare the fingerprints of `records` with the stored ones and yield
+        (status, key, record) tuples for new and changed records (and
+        unchanged ones with status `None`, if `unchanged` is set), followed
+        by (`deleted`, key, `None`) for all stored keys missing from
+        `records`.
+
+        The new fingerprints are saved, once the generator is exhausted,
+        unless `commit` is `False`; an interrupted run leaves the store as
+        it was.
+        """
+        conn = self._conn
+        try:
+            conn.execute('CREATE TEMP TABLE seen (key TEXT PRIMARY KEY) WITHOUT ROWID')
+            for batch in _chunked(records, self.batch_size):
+                rows = []
+                for record in batch:
+                    key = record.firstvalue(self.key)
+                    if key is not None:
+                        rows.append((key, record.fingerprint(exclude=self.exclude), record))
+                if not rows:
+                    continue
+                query = ('SELECT key, fingerprint FROM fingerprints WHERE key IN (%s)' %
+                         ', '.join('?' * len(rows)))
+                stored = dict(conn.execute(query, [key for key, _, _ in rows]))
+                for key, fingerprint, record in rows:
+                    previous = stored.get(key)
+                    if previous == fingerprint:
+                        if unchanged:
+                            yield None, key, record
+                        continue
+                    yield (self.NEW if previous is None else self.CHANGED), key, record
+                    stored[key] = fingerprint
+                    conn.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?)',
+                                 (key, fingerprint))
+                conn.executemany('INSERT OR IGNORE INTO seen VALUES (?)',
+                                 ((key,) for key, _, _ in rows))
+            deleted = conn.execute('SELECT key FROM fingerprints WHERE key NOT IN '
+                                   '(SELECT key FROM seen) ORDER BY key').fetchall()
+            for key, in deleted:
+                yield self.DELETED, key, None
+            conn.execute('DELETE FROM fingerprints WHERE key NOT IN (SELECT key FROM seen)')
+            if commit:
+                conn.commit()
+        finally:
+            conn.rollback()
+            conn.execute('DROP TABLE IF EXISTS temp.seen')
+
+
+MARC_XML_NS = 'http://www.loc.gov/MARC21/slim'
+
+_XML_RECORD_TAGS = ('{%s}record' % MARC_XML_NS, 'record')
+
+
+def _xml_local_name(tag):
+    return tag.rpartition('}')[2]
+
+
+def _xml_to_record(elem, kwargs):
+    """
+    Build a `Record` from a MARCXML `record` element.
+    """
+    record = Record(**kwargs)
+    rows = []
+    for child in elem:
+        name = _xml_local_name(child.tag)
+        if name == 'leader':
+            record.leader = pymarc.Leader(child.text or '')
+        elif name == 'controlfield':
+            rows.append((child.get('tag'), None, child.text or ''))
+        elif name == 'datafield':
+            rows.append((child.get('tag'),
+                         (child.get('ind1') or ' ', child.get('ind2') or ' '),
+                         [(sub.get('code'), sub.text or '') for sub in child]))
+    record.add_many(rows, trusted=True)
+    return record
+
+
+def iter_xml(source, **kwargs):
+    """
+    Yield a `Record` for each MARCXML record element in `source`, a path or
+    a file object. The document is parsed incrementally and each record
+    element is discarded after conversion, so memory use does not grow with
+    the size of the document. Records may be wrapped in other elements,
+    e.g. OAI-PMH responses. Keyword arguments are passed to the `Record`
+    constructor, e.g. `compact=True`.
+
+    >>> for record in iter_xml('collection.xml'):
+    ...     print(record.firstvalue('001'))
+    """
+    for elem in _iter_xml_elements(source):
+        yield _xml_to_record(elem, kwargs)
+
+
+def _iter_xml_elements(source):
+    """
+    Yield the MARCXML record elements in `source`, each element is
+    discarded, once the consumer asks for the next one.
+    """
+    stack, inside = [], 0
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            if elem.tag in _XML_RECORD_TAGS:
+                inside += 1
+            continue
+        stack.pop()
+        if elem.tag in _XML_RECORD_TAGS:
+            inside -= 1
+            yield elem
+        elif inside:
+            # Part of a record, cleared with the record.
+            continue
+        # Also drop finished wrapper elements, e.g. OAI-PMH headers.
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+
+def _xml_escape(value):
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _xml_attr(value):
+    return '"%s"' % _xml_escape(value).replace('"', '&quot;')
+
+
+def _record_to_xml(record):
+    """
+    Serialize a record as a MARCXML record element string.
+    """
+    parts = ['<record>\n<leader>%s</leader>\n' % _xml_escape(str(record.leader))]
+    for field in record.get_fields():
+        if field.control_field:
+            parts.append('<controlfield tag=%s>%s</controlfield>\n' % (
+                _xml_attr(field.tag), _xml_escape(field.data or '')))
+            continue
+        parts.append('<datafield tag=%s ind1=%s ind2=%s>\n' % (
+            _xml_attr(field.tag), _xml_attr(field.indicators[0]),
+            _xml_attr(field.indicators[1])))
+        for subfield in field.subfields:
+            parts.append('<subfield code=%s>%s</subfield>\n' % (
+                _xml_attr(subfield.code), _xml_escape(subfield.value)))
+        parts.append('</datafield>\n')
+    parts.append('</record>\n')
+    return ''.join(parts)
+
+
+class XMLWriter(object):
+    """
+    Write records as a MARCXML collection to a path or a binary file object.
+    Serialized records are buffered and written in chunks of
+    `chunk_records` records.
+
+    >>> with XMLWriter('out.xml') as writer:
+    ...     for record in records:
+    ...         writer.write(record)
+    """
+
+    def __init__(self, target, chunk_records=1000):
+        if hasattr(target, 'write'):
+            self._handle, self._close_handle = target, False
+        else:
+            self._handle, self._close_handle = open(target, 'wb'), True
+        self.chunk_records = chunk_records
+        self._buffer = []
+        self._handle.write(('<?xml version="1.0" encoding="UTF-8"?>\n'
+                            '<collection xmlns="%s">\n' % MARC_XML_NS).encode('utf-8'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, record):
+        """
+        Add a record to the collection.
+        """
+        self._buffer.append(_record_to_xml(record))
+        if len(self._buffer) >= self.chunk_records:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered records.
+        """
+        if self._buffer:
+            self._handle.write(''.join(self._buffer).encode('utf-8'))
+            self._buffer = []
+
+    def close(self):
+        """
+        Write pending records and close the collection. Closes the file,
+        if it has been opened by the writer.
+        """
+        self.flush()
+        self._handle.write(b'</collection>\n')
+        if self._close_handle:
+            self._handle.close()
+        else:
+            self._handle.flush()
+
+
+@functools.lru_cache(maxsize=4096)
+def _marcdoc_accessor(tag, prefix='_source', index='*'):
+    """
+    Compile a function, that returns the list of values for `tag` (e.g. 008,
+    020a or 020.a) in an ES document, just like the jsonpath expression
+    from `marcdoc.tag_to_expression`, with plain dict and list access.
+    """
+    tag = tag.replace('.', '').strip()
+    flat = len(tag) > 3
+    code = None
+    if len(tag) == 4:
+        tag, code = tag[:3], tag[3:]
+    keys = prefix.split('.') + ['content', tag]
+
+    def lookup(document):
+        value = document
+        for key in keys:
+            try:
+                value = value[key]
+            except (TypeError, KeyError, IndexError):
+                return []
+        if code is None:
+            return [value]
+        if not isinstance(value, list):
+            value = [value]
+        if index == '*':
+            items = value
+        else:
+            items = value[int(index):int(index) + 1]
+        matches = []
+        for item in items:
+            if isinstance(item, dict) and code in item:
+                matches.append(item[code])
+        return matches
+
+    if flat:
+        return lambda document: flatten(lookup(document))
+    return lookup
+
+
+class marcdoc(dict):
+    """ A wrapper around an dictionary that represents a MARC record.
+
+    Example document:
+
+        doc = {
+            "_index" : "bsz",
+            "_type" : "title",
+            "_id" : "036937401",
+            "_score" : 1.0,
+
+            "_source" : {
+                "content": {
+                    "245": [{"a": "De induratione hepatis /", ... } ],
+                    ...
+                },
+                "meta": {"date": "2014-03-04"}
+            }
+        }
+
+    Usage:
+
+        md = marcx.marcdoc(doc)
+        isbns = ', '.join(itertools.chain(md.x020a, md.x020z, md.x0209,
+                                          md.x776z))
+    """
+
+    def __init__(self, document, default_prefix='_source', default_index='*'):
+        warnings.warn("deprecated", DeprecationWarning)
+        dict.__init__(self, document)
+        self.document = document
+        self.default_prefix = default_prefix
+        self.default_index = default_index
+
+    def tag_to_expression(self, tag, prefix=None, index=None):
+        """ Return a multivalued parser for the given tag (e.g. 020 or 700.a).
+        """
+        import jsonpath_rw as jpath
+
+        if prefix is None:
+            prefix = self.default_prefix
+        if index is None:
+            index = self.default_index
+        tag = tag.replace('.', '').strip()
+        if 3 > len(tag) > 4:
+            raise ValueError('tag must be of the form 008, 020a or 020.a')
+        if len(tag) == 4:
+            tag, code = tag[:3], tag[3:]
+            return jpath.parse('{prefix}.content["{tag}"]'
+                               '[{index}].["{code}"]'.format(prefix=prefix,
+                                                             tag=tag, index=index, code=code))
+        else:
+            return jpath.parse('{prefix}.content["{tag}"]'.format(prefix=prefix,
+                                                                  tag=tag))
+
+    def isbns(self):
+        return itertools.chain(self.x020a, self.x020z, self.x0209, self.x776z)
+
+    def values(self, *args):
+        result = []
+        for arg in args:
+            accessor = _marcdoc_accessor(arg, self.default_prefix, self.default_index)
+            result += accessor(self.document)
+        return result
+
+    def __getattr__(self, name):
+        """ Dynamic attribute lookup. Converts `obj.x020a` attribute
+        into an accessor (the equivalent of a jsonpath expression),
+        evaluates it on the document and returns a *list* of values.
+        Accessors are compiled once per process.
+
+        Cannot start an attribute with a digit, so the first character
+        needs to be some letter.
+        """
+        if name.startswith('__'):
+            raise AttributeError(name)
+        try:
+            accessor = _marcdoc_accessor(name[1:], self.default_prefix,
+                                         self.default_index)
+            return accessor(self.document)
+        except Exception as exc:
+            raise AttributeError(exc)
+
+
+def _json_to_record(document, kwargs):
+    """
+    Build a `Record` from a MARC-in-JSON document, as written by
+    `pymarc.Record.as_json`.
+    """
+    record = Record(**kwargs)
+    if document.get('leader'):
+        record.leader = pymarc.Leader(document['leader'])
+    rows = []
+    for item in document.get('fields', ()):
+        for tag, value in item.items():
+            if isinstance(value, dict):
+                rows.append((tag, (value.get('ind1') or ' ', value.get('ind2') or ' '),
+                             [subfield for subfields in value.get('subfields', ())
+                              for subfield in subfields.items()]))
+            else:
+                rows.append((tag, None, value))
+    record.add_many(rows, trusted=True)
+    return record
+
+
+_FORMATS = ('marc', 'xml', 'json')
+
+
+def _guess_format(path):
+    """
+    Guess the format of a file from its name, binary MARC by default.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.xml':
+        return 'xml'
+    if extension in ('.json', '.jsonl', '.ndjson', '.ldj'):
+        return 'json'
+    return 'marc'
+
+
+def _iter_raw(handle, fmt):
+    """
+    Split a binary stream into serialized records of the given format.
+    """
+    if fmt == 'marc':
+        return (data for _, data in _iter_raw_records(handle))
+    if fmt == 'json':
+        return (line for line in handle if line.strip())
+    return (ET.tostring(elem) for elem in _iter_xml_elements(handle))
+
+
+def _decode_raw(data, fmt, force_utf8=False):
+    if fmt == 'marc':
+        return LazyRecord(data, force_utf8=force_utf8)
+    if fmt == 'json':
+        return _json_to_record(json.loads(data), {})
+    return _xml_to_record(ET.fromstring(data), {})
+
+
+def _encode_record(record, fmt):
+    if fmt == 'marc':
+        return record.as_marc()
+    if fmt == 'json':
+        return (json.dumps(record.as_dict(), ensure_ascii=False) + '\n').encode('utf-8')
+    return _record_to_xml(record).encode('utf-8')
+
+
+def _tsv_value(value):
+    if value is None:
+        return ''
+    return value.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+
+
+def _command_chunk(command, chunk, options):
+    """
+    Worker side of the command line tool: decode a chunk of serialized
+    records, apply the query and return the count (`count`), the matching
+    records serialized (`filter`) or TSV rows (`extract`) as bytes.
+    """
+    source, target, expr, specs, multi, force_utf8 = options
+    matches = query(expr) if expr else None
+    selected = []
+    for data in chunk:
+        record = _decode_raw(data, source, force_utf8)
+        if matches is None or matches(record):
+            selected.append((data, record))
+    if command == 'count':
+        return len(selected)
+    if command == 'filter':
+        if source == target == 'marc':
+            return b''.join(data for data, _ in selected)
+        if source == target == 'json':
+            return b''.join(data.rstrip(b'\r\n') + b'\n' for data, _ in selected)
+        return b''.join(_encode_record(record, target) for _, record in selected)
+    columns = _extract_columns(dict(enumerate(specs)))
+    batch = _extract_batch([record for _, record in selected], columns, multi, '|')
+    rows = zip(*(batch[i] for i in range(len(specs))))
+    return ''.join('\t'.join(map(_tsv_value, row)) + '\n' for row in rows).encode('utf-8')
+
+
+def main(argv=None):
+    """
+    The `marcx` command line tool, filter, extract values from and count
+    records in binary MARC, MARCXML or JSON lines files on a process pool.
+
+        $ marcx filter '020.a ^= "978" and not 912.a = "ZDB-1-X"' dump.mrc -o books.mrc
+        $ marcx extract 001,020.a,245.a dump.mrc > titles.tsv
+        $ marcx count -q '245.a ~ /python/i' dump.mrc
+    """
+    import argparse
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-f', '--from', dest='source', choices=_FORMATS,
+                        help='input format, guessed from the file name by default')
+    common.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of processes, number of CPUs by default')
+    common.add_argument('-k', '--keep-order', action='store_true',
+                        help='write results in input order')
+    common.add_argument('--chunk-records', type=int, default=1000,
+                        help='records passed to a worker at once')
+    common.add_argument('--force-utf8', action='store_true',
+                        help='decode binary MARC as UTF-8 regardless of the leader')
+    common.add_argument('-o', '--output', help='output file, standard output by default')
+
+    parser = argparse.ArgumentParser(prog='marcx', description=main.__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+    command = commands.add_parser('filter', parents=[common], help='write records matching a query')
+    command.add_argument('query', help='query, like \'020.a ^= "978"\'')
+    command.add_argument('-t', '--to', dest='target', choices=_FORMATS,
+                         help='output format, same as input by default')
+    command = commands.add_parser('extract', parents=[common], help='write values as TSV')
+    command.add_argument('specs', help='comma separated fieldspecs, one column each')
+    command.add_argument('-q', '--query', help='only extract from records matching a query')
+    command.add_argument('--first', action='store_const', const='first', dest='multi',
+                         default='join', help='only the first value per column, '
+                         'instead of all values separated by |')
+    command = commands.add_parser('count', parents=[common], help='count (matching) records')
+    command.add_argument('-q', '--query', help='only count records matching a query')
+    for command in commands.choices.values():
+        command.add_argument('files', metavar='FILE', nargs='*', default=[],
+                             help='input files, standard input by default')
+    # Input files may follow options, which argparse would reject for
+    # positional arguments of a subcommand.
+    args, rest = parser.parse_known_args(argv)
+    unknown = [arg for arg in rest if arg.startswith('-') and arg != '-']
+    if unknown:
+        parser.error('unrecognized arguments: %s' % ' '.join(unknown))
+    args.files = (args.files + rest) or ['-']
+
+    for path in args.files:
+        if path != '-' and not os.path.isfile(path):
+            parser.error('no such file: %s' % path)
+
+    if args.query:
+        try:
+            query(args.query)
+        except ValueError as exc:
+            parser.error(str(exc))
+    specs = ()
+    if args.command == 'extract':
+        specs = [spec.strip() for spec in args.specs.split(',') if spec.strip()]
+        if not specs or None in map(fieldspec, specs):
+            parser.error('invalid fieldspecs: %s' % args.specs)
+    sources = [args.source or ('marc' if path == '-' else _guess_format(path))
+               for path in args.files]
+    target = getattr(args, 'target', None) or sources[0]
+
+    def tasks():
+        for path, source in zip(args.files, sources):
+            if path == '-':
+                handle = sys.stdin.buffer
+            else:
+                handle = open(path, 'rb')
+            try:
+                options = (source, target, args.query, specs,
+                           getattr(args, 'multi', None), args.force_utf8)
+                for chunk in _chunked(_iter_raw(handle, source), args.chunk_records):
+                    yield args.command, chunk, options
+            finally:
+                if handle is not sys.stdin.buffer:
+                    handle.close()
+
+    if args.command == 'count' and not args.query:
+        results = (len(chunk) for _, chunk, _ in tasks())
+    else:
+        results = _map_chunks(_command_chunk, tasks(), args.workers,
+                              ordered=args.keep_order)
+
+    if args.output:
+        output = open(args.output, 'wb')
+    else:
+        output = sys.stdout.buffer
+    try:
+        if args.command == 'count':
+            output.write(b'%d\n' % sum(results))
+            return
+        if target == 'xml' and args.command == 'filter':
+            output.write(('<?xml version="1.0" encoding="UTF-8"?>\n'
+                          '<collection xmlns="%s">\n' % MARC_XML_NS).encode('utf-8'))
+        for result in results:
+            output.write(result)
+        if target == 'xml' and args.command == 'filter':
+            output.write(b'</collection>\n')
+    except BrokenPipeError:
+        # Output closed early, e.g. piped into head; keep the interpreter
+        # from failing to flush stdout at exit.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if output is sys.stdout.buffer:
+            output.flush()
+        else:
+            output.close()
+
+
+def __getattr__(name):
+    # Submodules, that are only needed occasionally, are imported on first
+    # access, e.g. `marcx.synth`.
+    if name == 'synth':
+        import importlib
+        return importlib.import_module('marcx.synth')
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
@@ -0,0 +1,11 @@
+# coding: utf-8
+
+"""
+Run the marcx command line tool with `python -m marcx`.
+"""
+
+import sys
+
+from marcx import main
+
+sys.exit(main())
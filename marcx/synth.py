@@ -0,0 +1,427 @@
+# coding: utf-8
+
+"""
+Deterministic synthetic MARC records for tests and benchmarks.
+
+The same `seed` and profile always produce the same records; every record
+is generated from its own seed, so the n-th record does not depend on how
+many records are generated and large files can be written in parallel:
+
+>>> from marcx import synth
+>>> for record in synth.generate(1000, seed=42, profile='subject_chains'):
+...     print(record.firstvalue('001'))
+
+>>> synth.write('corpus.mrc', 1000000, seed=42, profile='heavy_9xx', workers=8)
+>>> synth.write('corpus.xml', 1000, format='xml')
+
+A profile lists the fields of a record as tuples of tag (or a tuple of
+tags to choose from), occurrence range, indicators (a string or a tuple of
+choices, `None` for control fields) and, for control fields, a value or,
+for other fields, a list of (code, occurrence range, value) subfields.
+Values are either a (min, max) length range for random text or the name of
+a generator in `VALUES`, like `isbn` or `gnd`. Profiles are plain data and
+can be copied and modified, see `PROFILES`.
+"""
+
+import functools
+import operator
+import random
+
+import marcx
+
+__all__ = ['PROFILES', 'VALUES', 'generate', 'write']
+
+_SYLLABLES = ('al', 'an', 'ber', 'bib', 'chi', 'da', 'der', 'ein', 'en', 'ge',
+              'gra', 'his', 'in', 'ka', 'lo', 'lit', 'ma', 'mü', 'ne', 'ni',
+              'phie', 'rei', 'ro', 'sa', 'schaft', 'se', 'sti', 'ta', 'te',
+              'the', 'ti', 'to', 'tum', 'un', 'ver', 'wis', 'zé', 'zu')
+
+# Number of characters of random text values are cut from.
+_POOL_SIZE = 1 << 18
+
+# Record i is generated with seed * _SEED_STRIDE + i.
+_SEED_STRIDE = 1 << 40
+
+# Largest field and record in bytes, the directory has four digits for the
+# length of a field, the leader five for the length of a record.
+_MAX_FIELD = 9999
+_MAX_RECORD = 99999
+
+
+def _isbn(rng, i):
+    return '978%010d' % int(rng.random() * 10 ** 10)
+
+
+def _year(rng, i):
+    return '%d' % (1800 + int(rng.random() * 225))
+
+
+def _lang(rng, i):
+    return ('ger', 'eng', 'fre', 'lat', 'ita', 'spa', 'rus')[int(rng.random() * 7)]
+
+
+def _gnd(rng, i):
+    return '(DE-588)%d-%d' % (int(rng.random() * 10 ** 8), int(rng.random() * 10))
+
+
+VALUES = {
+    'id': lambda rng, i: '%09d' % (i + 1),
+    'isil': lambda rng, i: 'DE-%d' % (1 + int(rng.random() * 999)),
+    'timestamp': lambda rng, i: '2020%02d%02d%06d.0' % (
+        1 + int(rng.random() * 12), 1 + int(rng.random() * 28), int(rng.random() * 240000)),
+    'fixed': lambda rng, i: '%02d%02d%02ds%s    gw |||||||||||||| ||ger c' % (
+        int(rng.random() * 100), 1 + int(rng.random() * 12), 1 + int(rng.random() * 28),
+        _year(rng, i)),
+    'isbn': _isbn,
+    'year': _year,
+    'lang': _lang,
+    'gnd': _gnd,
+    'ocn': lambda rng, i: '(OCoLC)%d' % int(rng.random() * 10 ** 9),
+    'zdb': lambda rng, i: 'ZDB-%d-%s' % (1 + int(rng.random() * 200),
+                                         ('SOJ', 'SEM', 'DGR', 'X')[int(rng.random() * 4)]),
+    'url': lambda rng, i: 'https://example.org/%d' % int(rng.random() * 10 ** 8),
+}
+
+_BIBLIOGRAPHIC = [
+    ('001', (1, 1), None, 'id'),
+    ('003', (1, 1), None, 'isil'),
+    ('005', (1, 1), None, 'timestamp'),
+    ('008', (1, 1), None, 'fixed'),
+    ('020', (0, 3), '  ', [('a', (1, 1), 'isbn')]),
+    ('035', (1, 3), '  ', [('a', (1, 1), 'ocn')]),
+    ('040', (1, 1), '  ', [('a', (1, 1), 'isil'), ('b', (1, 1), 'lang'), ('c', (1, 1), 'isil')]),
+    ('041', (0, 1), ('0 ', '1 '), [('a', (1, 2), 'lang')]),
+    ('084', (0, 3), '  ', [('a', (1, 1), (2, 8)), ('2', (1, 1), (3, 6))]),
+    ('100', (0, 1), '1 ', [('a', (1, 1), (8, 30)), ('d', (0, 1), (9, 9)),
+                           ('0', (0, 2), 'gnd'), ('4', (0, 1), (3, 3))]),
+    ('245', (1, 1), ('10', '00', '14'), [('a', (1, 1), (10, 120)), ('b', (0, 1), (10, 80)),
+                                         ('c', (0, 1), (10, 60))]),
+    ('250', (0, 1), '  ', [('a', (1, 1), (5, 20))]),
+    ('264', (1, 1), ' 1', [('a', (1, 1), (5, 20)), ('b', (1, 1), (5, 40)),
+                           ('c', (1, 1), 'year')]),
+    ('300', (1, 1), '  ', [('a', (1, 1), (5, 30)), ('c', (0, 1), (4, 10))]),
+    ('490', (0, 1), '0 ', [('a', (1, 1), (10, 60)), ('v', (0, 1), (1, 6))]),
+    ('500', (0, 3), '  ', [('a', (1, 1), (20, 200))]),
+    ('650', (0, 6), ' 7', [('a', (1, 1), (5, 40)), ('0', (0, 2), 'gnd'), ('2', (1, 1), (3, 6))]),
+    ('689', (0, 6), ('00', '01', '02', '10', '11'),
+     [('A', (1, 1), (1, 1)), ('0', (1, 2), 'gnd'), ('a', (1, 1), (5, 40)),
+      ('D', (1, 1), (1, 1)), ('5', (0, 1), 'isil')]),
+    ('700', (0, 5), '1 ', [('a', (1, 1), (8, 30)), ('0', (0, 2), 'gnd'), ('4', (0, 1), (3, 3))]),
+    ('856', (0, 2), '40', [('u', (1, 1), 'url'), ('3', (0, 1), (5, 20))]),
+    ('912', (0, 3), '  ', [('a', (1, 1), 'zdb')]),
+    ('935', (0, 2), '  ', [('a', (1, 1), (3, 8)), ('b', (0, 1), (3, 8))]),
+    ('980', (1, 2), '  ', [('a', (1, 1), (8, 10)), ('b', (1, 1), (1, 3)), ('c', (0, 1), (2, 5))]),
+]
+
+
+def _with(fields, *extra):
+    """
+    Return a profile with `extra` fields, which replace fields with the
+    same tag in `fields`.
+    """
+    tags = set(item[0] for item in extra)
+    return [item for item in fields if item[0] not in tags] + list(extra)
+
+
+PROFILES = {
+    # An average monograph.
+    'bibliographic': {
+        'leader': '00000nam a2200000 c 4500',
+        'fields': _BIBLIOGRAPHIC,
+    },
+    # Lots of local fields, like in union catalogue exports.
+    'heavy_9xx': {
+        'leader': '00000nam a2200000 c 4500',
+        'fields': _with(_BIBLIOGRAPHIC, (
+            ('900', '910', '912', '924', '935', '936', '950', '951', '980', '981',
+             '983', '984', '985'), (15, 60), ('  ', '1 ', ' 1'),
+            [('a', (1, 3), (3, 30)), ('b', (0, 2), (2, 12)), ('x', (0, 1), (1, 10)),
+             ('9', (0, 1), 'isil')])),
+    },
+    # Long subject chains, as in records from the German union catalogues.
+    'subject_chains': {
+        'leader': '00000nam a2200000 c 4500',
+        'fields': _with(_BIBLIOGRAPHIC, (
+            '689', (20, 80), ('00', '01', '02', '03', '04', '10', '11', '12', '20', '21'),
+            [('A', (1, 1), (1, 1)), ('0', (1, 3), 'gnd'), ('a', (1, 1), (5, 40)),
+             ('x', (0, 2), (5, 30)), ('D', (1, 1), (1, 1)), ('5', (0, 1), 'isil')])),
+    },
+    # Formatted contents notes, many titles and long unformatted notes.
+    'contents': {
+        'leader': '00000nam a2200000 c 4500',
+        'fields': _with(_BIBLIOGRAPHIC, (
+            '505', (1, 4), ('00', '0 ', '8 '),
+            [('a', (0, 1), (500, 4000)), ('t', (0, 30), (10, 80)), ('r', (0, 30), (8, 30))])),
+    },
+    # Holdings records.
+    'holdings': {
+        'leader': '00000nx  a2200000   4500',
+        'fields': [
+            ('001', (1, 1), None, 'id'),
+            ('004', (1, 1), None, 'id'),
+            ('005', (1, 1), None, 'timestamp'),
+            ('008', (1, 1), None, 'fixed'),
+            ('852', (1, 3), ('  ', '0 ', '8 '),
+             [('a', (1, 1), 'isil'), ('b', (0, 1), (2, 20)), ('c', (0, 1), (2, 20)),
+              ('h', (1, 1), (5, 25)), ('x', (0, 2), (5, 60)), ('z', (0, 1), (10, 80))]),
+            ('866', (0, 5), '30', [('a', (1, 1), (10, 200)), ('z', (0, 1), (5, 60))]),
+            ('924', (0, 3), '  ', [('a', (1, 1), (5, 12)), ('b', (1, 1), 'isil'),
+                                   ('d', (0, 1), (1, 2)), ('g', (0, 1), (5, 25))]),
+            (('935', '980', '981', '983'), (5, 20), '  ',
+             [('a', (1, 2), (3, 30)), ('b', (0, 1), (2, 12))]),
+        ],
+    },
+}
+
+
+@functools.lru_cache(maxsize=8)
+def _pool(seed):
+    """
+    Random text, that values are cut from: syllables and on average one
+    blank for every two syllables.
+    """
+    rng = random.Random(seed)
+    tokens = _SYLLABLES + (' ',)
+    weights = [1] * len(_SYLLABLES) + [len(_SYLLABLES) // 2]
+    text = ''.join(rng.choices(tokens, weights, k=_POOL_SIZE // 3))
+    return ' '.join(text.split())
+
+
+def _scaled(bounds, scale):
+    """
+    Scale an occurrence or length range, required single items stay as
+    they are.
+    """
+    low, high = bounds
+    if scale == 1 or high <= 1:
+        return low, high
+    return int(round(low * scale)), max(1, int(round(high * scale)))
+
+
+def _compile_value(spec, rng, pool, lengths):
+    """
+    Return a function of the record number, that returns a value.
+    """
+    if isinstance(spec, str):
+        function = VALUES[spec]
+        return lambda i: function(rng, i)
+    low, high = _scaled(spec, lengths)
+    span = high - low + 1
+    limit = len(pool) - high
+    random = rng.random
+
+    def text(i):
+        # One random number for start and length.
+        position = random() * limit
+        start = int(position)
+        value = pool[start:start + low + int((position - start) * span)].strip()
+        return value or 'x'
+    return text
+
+
+def _compile(profile, rng, pool, fields, subfields, lengths):
+    """
+    Turn the field list of a profile into a list of (tags, number of tags,
+    low, span, indicators, number of indicators, content) tuples, where
+    content is a value function for control fields and a list of (code,
+    low, span, value function) tuples otherwise.
+    """
+    compiled = []
+    for tags, bounds, indicators, content in profile['fields']:
+        if isinstance(tags, str):
+            tags = (tags,)
+        low, high = _scaled(bounds, fields)
+        if isinstance(indicators, str):
+            indicators = (indicators,)
+        if indicators is None:
+            content = _compile_value(content, rng, pool, lengths)
+        else:
+            content = [(code,) + _span(_scaled(occurs, subfields)) +
+                       (_compile_value(value, rng, pool, lengths),)
+                       for code, occurs, value in content]
+        compiled.append((tags, len(tags), low, high - low + 1, indicators,
+                         len(indicators or ()), content))
+    return compiled
+
+
+def _span(bounds):
+    return bounds[0], bounds[1] - bounds[0] + 1
+
+
+def _size(value):
+    return len(value) if value.isascii() else len(value.encode('utf-8'))
+
+
+def _cut(value, size):
+    """
+    Cut `value` to at most `size` bytes (UTF-8).
+    """
+    if value.isascii():
+        return value[:size]
+    return value.encode('utf-8')[:size].decode('utf-8', 'ignore')
+
+
+def _fit(values, size):
+    """
+    Return the subfield values, that fit into a field of `size` bytes
+    (with indicators and field terminator), the last one cut if needed,
+    and the size of the field.
+    """
+    fitted, used = [], 3
+    for code, value in values:
+        room = size - used - 2
+        if room <= 0:
+            break
+        length = _size(value)
+        if length > room:
+            value = _cut(value, room).rstrip()
+            if value:
+                fitted.append((code, value))
+                used += 2 + _size(value)
+            break
+        fitted.append((code, value))
+        used += 2 + length
+    return fitted, used
+
+
+def _rows(start, stop, seed, profile, fields, subfields, lengths):
+    """
+    Yield (leader, rows) tuples for the records from `start` to `stop`, rows
+    as taken by `Record.add_many`. Text values are cut, so that no field is
+    longer than 9999 bytes; fields, that do not fit into a record of 99999
+    bytes, are left out.
+    """
+    if isinstance(profile, str):
+        if profile not in PROFILES:
+            raise ValueError('unknown profile %r, available: %s' % (
+                profile, ', '.join(sorted(PROFILES))))
+        profile = PROFILES[profile]
+    rng = random.Random()
+    compiled = _compile(profile, rng, _pool(seed), fields, subfields, lengths)
+    leader = profile.get('leader', '00000nam a2200000   4500')
+    random_ = rng.random
+    by_tag = operator.itemgetter(0)
+    for i in range(start, stop):
+        rng.seed(seed * _SEED_STRIDE + i)
+        rows = []
+        # Leader, directory terminator and record terminator.
+        room = _MAX_RECORD - 26
+        for tags, ntags, low, span, indicators, nindicators, content in compiled:
+            if span > 1:
+                low += int(random_() * span)
+            for _ in range(low):
+                tag = tags[int(random_() * ntags)] if ntags > 1 else tags[0]
+                if indicators is None:
+                    data = content(i)
+                    size = _size(data) + 1
+                    if size > _MAX_FIELD:
+                        data = _cut(data, _MAX_FIELD - 1)
+                        size = _size(data) + 1
+                    if size + 12 <= room:
+                        rows.append((tag, None, data))
+                        room -= size + 12
+                    continue
+                values = [(code, value(i))
+                          for code, code_low, code_span, value in content
+                          for _ in range(code_low + int(random_() * code_span)
+                                         if code_span > 1 else code_low)]
+                if not values:
+                    continue
+                size = 3 + 2 * len(values) + sum([len(value) if value.isascii() else
+                                                  len(value.encode('utf-8'))
+                                                  for _, value in values])
+                if size > _MAX_FIELD:
+                    values, size = _fit(values, _MAX_FIELD)
+                if size + 12 <= room:
+                    rows.append((tag, indicators[int(random_() * nindicators)]
+                                 if nindicators > 1 else indicators[0], values))
+                    room -= size + 12
+        rows.sort(key=by_tag)
+        yield leader, rows
+
+
+def generate(n, seed=0, profile='bibliographic', fields=1.0, subfields=1.0,
+             lengths=1.0, **kwargs):
+    """
+    Yield `n` synthetic `marcx.Record` objects. `profile` is the name of a
+    profile in `PROFILES` or a profile dictionary. `fields`, `subfields` and
+    `lengths` scale the number of repeatable fields, of repeatable
+    subfields and the length of text values. Keyword arguments are passed
+    to the `Record` constructor, e.g. `compact=True`.
+
+    >>> records = list(generate(100, seed=1, profile='heavy_9xx', lengths=2))
+    """
+    for leader, rows in _rows(0, n, seed, profile, fields, subfields, lengths):
+        yield marcx.Record.from_fields(rows, leader=leader, trusted=True, **kwargs)
+
+
+def _encode(leader, rows):
+    """
+    Encode rows as binary MARC21 (UTF-8), the same as `Record.as_marc`,
+    without building fields first.
+    """
+    directory = []
+    data = []
+    offset = 0
+    for tag, indicators, content in rows:
+        if indicators is None:
+            field = content + '\x1e'
+        else:
+            field = indicators + ''.join(['\x1f%s%s' % subfield for subfield in content]) + '\x1e'
+        size = len(field) if field.isascii() else len(field.encode('utf-8'))
+        directory.append('%s%04d%05d' % (tag, size, offset))
+        data.append(field)
+        offset += size
+    base = 24 + 12 * len(directory) + 1
+    head = '%05d%s%05d%s%s\x1e' % (base + offset + 1, leader[5:9] + 'a' + leader[10:12],
+                                    base, leader[17:], ''.join(directory))
+    return head.encode('ascii') + ''.join(data).encode('utf-8') + b'\x1d'
+
+
+def _write_chunk(start, stop, options):
+    """
+    Return records `start` to `stop` serialized as bytes.
+    """
+    seed, profile, format, fields, subfields, lengths = options
+    records = _rows(start, stop, seed, profile, fields, subfields, lengths)
+    if format == 'marc':
+        return b''.join(_encode(leader, rows) for leader, rows in records)
+    return ''.join(marcx._record_to_xml(marcx.Record.from_fields(rows, leader=leader, trusted=True))
+                   for leader, rows in records).encode('utf-8')
+
+
+def write(target, n, seed=0, profile='bibliographic', format='marc', fields=1.0,
+          subfields=1.0, lengths=1.0, workers=1, chunk_records=10000):
+    """
+    Write `n` synthetic records as binary MARC21 (`format='marc'`, the
+    default) or MARCXML (`format='xml'`) to `target`, a path or a binary
+    file object. Takes the same arguments as `generate`, produces the same
+    records. Binary MARC is encoded straight from the generated values,
+    without building fields. With `workers` other than 1 (`None` for one
+    per CPU), chunks of `chunk_records` records are generated on a process
+    pool. Returns the number of records written.
+    """
+    if format not in ('marc', 'xml'):
+        raise ValueError('format must be marc or xml')
+    if isinstance(profile, str) and profile not in PROFILES:
+        raise ValueError('unknown profile %r, available: %s' % (
+            profile, ', '.join(sorted(PROFILES))))
+    options = (seed, profile, format, fields, subfields, lengths)
+    tasks = ((start, min(n, start + chunk_records), options)
+             for start in range(0, n, chunk_records))
+    if hasattr(target, 'write'):
+        handle = target
+    else:
+        handle = open(target, 'wb')
+    try:
+        if format == 'xml':
+            handle.write(('<?xml version="1.0" encoding="UTF-8"?>\n'
+                          '<collection xmlns="%s">\n' % marcx.MARC_XML_NS).encode('utf-8'))
+        for data in marcx._map_chunks(_write_chunk, tasks, workers):
+            handle.write(data)
+        if format == 'xml':
+            handle.write(b'</collection>\n')
+    finally:
+        if handle is not target:
+            handle.close()
+    return n
@@ -32,5 +32,6 @@ setup(name='marcx',
       author='Martin Czygan',
       author_email='martin.czygan@gmail.com',
       url='https://github.com/ubleipzig/marcx',
-      py_modules=['marcx'],
+      packages=['marcx'],
+      entry_points={'console_scripts': ['marcx = marcx:main']},
       install_requires=['pymarc>=5.0', 'jsonpath-rw>=1.3.0', 'ply>=3.4', 'future>=0.16'])
@@ -25,3 +25,52 @@ class DotDictTest(unittest.TestCase):
         doc = {'a': 'A', 'b': {'c': {'d': ['e', 'f']}}}
         d = marcx.DotDict(doc)
         self.assertEqual(d.b.c.d[1], 'f')
+
+
+class LazyDotDictTest(unittest.TestCase):
+
+    def test_nested_access(self):
+        doc = {'a': 'A', 'b': {'c': {'d': ['e', {'f': 'g'}]}}}
+        d = marcx.LazyDotDict(doc)
+        self.assertEqual(d.a, 'A')
+        self.assertEqual(d.b.c.d[0], 'e')
+        self.assertEqual(d.b.c.d[1].f, 'g')
+        self.assertEqual(d['b']['c'].d[1]['f'], 'g')
+        self.assertEqual(d, doc)
+
+    def test_wraps_on_access_only(self):
+        doc = {'a': {'b': 1}, 'c': {'d': 2}}
+        d = marcx.LazyDotDict(doc)
+        self.assertIs(dict.__getitem__(d, 'a'), doc['a'])
+        self.assertIsInstance(d.a, marcx.LazyDotDict)
+        self.assertIs(d.a, d.a)
+        self.assertIs(dict.__getitem__(d, 'c'), doc['c'])
+        self.assertFalse(hasattr(d, '__dict__') and d.__dict__)
+
+    def test_single_storage(self):
+        d = marcx.LazyDotDict(a=1)
+        d.b = 2
+        d.a = 3
+        self.assertEqual(d, {'a': 3, 'b': 2})
+        del d.b
+        self.assertEqual(d, {'a': 3})
+        with self.assertRaises(AttributeError):
+            d.missing
+        with self.assertRaises(AttributeError):
+            del d.missing
+
+    def test_get_values_items(self):
+        d = marcx.LazyDotDict({'a': {'b': 1}, 'c': [{'d': 2}], 'values': 3})
+        self.assertEqual(d.get('a').b, 1)
+        self.assertIsNone(d.get('missing'))
+        self.assertEqual(d.get('missing', 4), 4)
+        values = d.values()
+        self.assertIn(3, values)
+        self.assertIn(marcx.LazyDotDict({'b': 1}), values)
+        self.assertIsInstance(values[1][0], marcx.LazyDotDict)
+        items = dict(d.items())
+        self.assertIsInstance(items['a'], marcx.LazyDotDict)
+        self.assertEqual(items['c'][0].d, 2)
+        self.assertIs(d.get('a'), d.a)
+        self.assertTrue(callable(d.values))
+        self.assertEqual(d['values'], 3)
@@ -4,11 +4,16 @@
 Tests for ES marc.
 """
 
+import os
+import subprocess
+import sys
 import unittest
 
 import marcx
 import warnings
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 DOC_03692895X = {u'_id': u'03692895X',
  u'_index': u'bsz',
  u'_score': 1.0,
@@ -275,3 +280,34 @@ class MarcDocTest(unittest.TestCase):
                            u"E\u0301cole Franc\u0327. d'Athe\u0300nes,",
                            u'1976'],
                            em.values('260.a', '260.b', '260.c'))
+
+    def test_accessors_are_shared(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            first = marcx.marcdoc(DOC_091849799)
+            second = marcx.marcdoc(DOC_03692895X)
+        self.assertEqual(first.x245a, [u'Introduction to algorithms /'])
+        self.assertEqual(second.x245a, [u'De hydrophobia nonnulla /'])
+        self.assertIs(marcx._marcdoc_accessor('245a'), marcx._marcdoc_accessor('245a'))
+
+    def test_control_fields_and_index(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            em = marcx.marcdoc(DOC_03692895X)
+            first = marcx.marcdoc(DOC_03692895X, default_index=1)
+        self.assertEqual(em.x001, [u'03692895X'])
+        self.assertEqual(em.x001a, [])
+        self.assertEqual(em.x041a, [u'lat', u'lat.'])
+        self.assertEqual(first.x041a, [u'lat.'])
+        with self.assertRaises(AttributeError):
+            em.__deepcopy__
+
+    def test_jsonpath_is_imported_lazily(self):
+        code = ('import sys, marcx; print(sorted(set(sys.modules) & {"jsonpath_rw", "ply", '
+                '"sqlite3", "concurrent.futures"}))')
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+        self.assertEqual(output.strip(), b'[]')
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            em = marcx.marcdoc(DOC_03692895X)
+        self.assertEqual(str(em.tag_to_expression('041a')), '_source.content.041.[*].a')
@@ -0,0 +1,521 @@
+# coding: utf-8
+# pylint: disable=C0111
+
+"""
+Tests for reading and processing MARC files.
+"""
+
+import io
+import json
+import operator
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+import unittest
+
+import pymarc
+
+import marcx
+
+
+def _make_record(i):
+    record = marcx.Record()
+    record.add('001', data='id-%04d' % i)
+    record.add('020', a='978%010d' % i)
+    record.add('245', a='Title %s' % i, c='Author äöü')
+    return record
+
+
+class FileTestCase(unittest.TestCase):
+
+    size = 25
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'records.mrc')
+        with open(self.path, 'wb') as handle:
+            for i in range(self.size):
+                handle.write(_make_record(i).as_marc())
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+
+class ProcessTests(FileTestCase):
+
+    def test_raw_records(self):
+        with open(self.path, 'rb') as handle:
+            raw = list(marcx._iter_raw_records(handle))
+        self.assertEqual(len(raw), self.size)
+        self.assertEqual(raw[0][0], 0)
+        self.assertEqual(raw[1][0], len(raw[0][1]))
+
+    def test_raw_records_truncated(self):
+        with open(self.path, 'rb') as handle:
+            data = handle.read()
+        with self.assertRaises(pymarc.exceptions.TruncatedRecord):
+            list(marcx._iter_raw_records(io.BytesIO(data[:-10])))
+        with self.assertRaises(pymarc.exceptions.RecordLengthInvalid):
+            list(marcx._iter_raw_records(io.BytesIO(b'abcde' + data)))
+
+    def test_process_single_worker(self):
+        getter = operator.methodcaller('firstvalue', '001')
+        ids = list(marcx.process(self.path, getter, workers=1, chunk_records=4))
+        self.assertEqual(ids, ['id-%04d' % i for i in range(self.size)])
+
+    def test_process_ordered(self):
+        getter = operator.methodcaller('firstvalue', '245.c')
+        values = list(marcx.process(self.path, getter, workers=2, chunk_records=3))
+        self.assertEqual(values, ['Author äöü'] * self.size)
+
+        getter = operator.methodcaller('firstvalue', '001')
+        with open(self.path, 'rb') as handle:
+            ids = list(marcx.process(handle, getter, workers=2, chunk_records=3))
+        self.assertEqual(ids, ['id-%04d' % i for i in range(self.size)])
+
+    def test_process_unordered(self):
+        getter = operator.methodcaller('firstvalue', '001')
+        ids = marcx.process(self.path, getter, workers=3, chunk_records=2, ordered=False)
+        self.assertEqual(sorted(ids), ['id-%04d' % i for i in range(self.size)])
+
+    def test_process_early_exit(self):
+        getter = operator.methodcaller('firstvalue', '001')
+        results = marcx.process(self.path, getter, workers=2, chunk_records=1)
+        self.assertEqual(next(results), 'id-0000')
+        results.close()
+
+
+class LazyRecordTests(FileTestCase):
+
+    def test_iter_lazy(self):
+        records = list(marcx.iter_lazy(self.path))
+        self.assertEqual(len(records), self.size)
+        self.assertTrue(all(isinstance(r, marcx.LazyRecord) for r in records))
+        record = records[3]
+        self.assertEqual(record.firstvalue('001'), 'id-0003')
+        self.assertEqual(record.values('245.c'), ['Author äöü'])
+        self.assertEqual(record['020']['a'], '9780000000003')
+        self.assertTrue('245' in record)
+        self.assertFalse('999' in record)
+        self.assertTrue(record.has_all('001', '020.a'))
+        self.assertTrue(record.test('020.a', marcx._startswith('978')))
+
+    def test_decodes_only_touched_fields(self):
+        record = next(marcx.iter_lazy(self.path))
+        self.assertEqual(record.firstvalue('001'), 'id-0000')
+        self.assertEqual(sum(1 for f in record._decoded if f is not None), 1)
+        self.assertEqual(len(record.get_fields('001', '245')), 2)
+        self.assertEqual(sum(1 for f in record._decoded if f is not None), 2)
+
+    def test_same_as_record(self):
+        with open(self.path, 'rb') as handle:
+            data = handle.read()
+        for lazy in marcx.iter_lazy(self.path):
+            record = marcx.Record(data=data[lazy.offset:lazy.offset + lazy.length])
+            self.assertEqual(str(lazy), str(record))
+            self.assertEqual(lazy.as_marc(), record.as_marc())
+            self.assertEqual(lazy.flatten(), record.flatten())
+
+    def test_materialize_on_mutation(self):
+        record = next(marcx.iter_lazy(self.path))
+        record.add('999', a='new')
+        self.assertIs(record.__class__, marcx.Record)
+        self.assertEqual(record.values('001', '999.a'), ['id-0000', 'new'])
+        self.assertEqual(len(record.fields), 4)
+
+        record = next(marcx.iter_lazy(self.path))
+        record.remove('020')
+        self.assertIs(record.__class__, marcx.Record)
+        self.assertFalse(record.has('020'))
+
+        record = next(marcx.iter_lazy(self.path))
+        self.assertEqual(len(record.fields), 3)
+        self.assertIs(record.__class__, marcx.Record)
+
+    def test_as_marc_after_edit(self):
+        with open(self.path, 'rb') as handle:
+            data = handle.read()
+        record = next(marcx.iter_lazy(self.path))
+        self.assertTrue(record.test('020.a', marcx._startswith('978')))
+        self.assertEqual(record.as_marc(), data[:record.length])
+
+        record['245']['a'] = 'New'
+        self.assertEqual(marcx.Record(data=record.as_marc()).firstvalue('245.a'), 'New')
+
+        for access in (lambda r: r.get('245'), lambda r: r.get_fields('245')[0],
+                       lambda r: next(r.iterfields('245'))[0],
+                       lambda r: [f for f in r if f.tag == '245'][0]):
+            record = next(marcx.iter_lazy(self.path))
+            access(record)['a'] = 'New'
+            self.assertEqual(marcx.Record(data=record.as_marc()).firstvalue('245.a'), 'New')
+
+        record = next(marcx.iter_lazy(self.path))
+        record.leader = record.leader[:5] + 'c' + record.leader[6:]
+        self.assertEqual(marcx.Record(data=record.as_marc()).leader[5], 'c')
+
+    def test_empty_file(self):
+        path = os.path.join(self.tempdir, 'empty.mrc')
+        open(path, 'wb').close()
+        self.assertEqual(list(marcx.iter_lazy(path)), [])
+
+
+class IndexTests(FileTestCase):
+
+    def test_build_and_lookup(self):
+        index_path = marcx.build_index(self.path)
+        self.assertEqual(index_path, self.path + '.idx')
+        with marcx.IndexedFile(self.path) as records:
+            self.assertEqual(len(records), self.size)
+            self.assertTrue('id-0007' in records)
+            self.assertFalse('id-9999' in records)
+            record = records.get('id-0007')
+            self.assertIsInstance(record, marcx.Record)
+            self.assertEqual(record.firstvalue('020.a'), '9780000000007')
+            self.assertIsNone(records.get('id-9999'))
+
+            found = list(records.get_many(['id-0012', 'id-9999', 'id-0002', 'id-0012']))
+            self.assertEqual([key for key, _ in found], ['id-0002', 'id-0012'])
+            self.assertEqual([r.firstvalue('001') for _, r in found], ['id-0002', 'id-0012'])
+
+    def test_other_key(self):
+        index_path = os.path.join(self.tempdir, 'isbn.idx')
+        marcx.build_index(self.path, key='020.a', index_path=index_path)
+        with marcx.IndexedFile(self.path, index_path=index_path) as records:
+            self.assertEqual(records.key, '020.a')
+            self.assertEqual(records.get('9780000000011').firstvalue('001'), 'id-0011')
+
+    def test_missing_or_stale_index(self):
+        with self.assertRaises(IOError):
+            marcx.IndexedFile(self.path)
+        marcx.build_index(self.path)
+        with open(self.path, 'ab') as handle:
+            handle.write(_make_record(99).as_marc())
+        with self.assertRaises(ValueError):
+            marcx.IndexedFile(self.path)
+
+    def test_same_size_replacement(self):
+        marcx.build_index(self.path)
+        with open(self.path, 'rb') as handle:
+            records = [data for _, data in marcx._iter_raw_records(handle)]
+        stat = os.stat(self.path)
+        # Same size, different offsets: record 1 moves to the end.
+        with open(self.path, 'wb') as handle:
+            handle.write(b''.join(records[:1] + records[2:] + records[1:2]))
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(os.path.getsize(self.path), stat.st_size)
+        with self.assertRaises(ValueError):
+            marcx.IndexedFile(self.path)
+
+        out = io.BytesIO()
+        delta = os.path.join(self.tempdir, 'delta.mrc')
+        open(delta, 'wb').close()
+        marcx.apply_delta(self.path, delta, out)
+        with marcx.IndexedFile(self.path) as indexed:
+            self.assertEqual(indexed.get('id-0001').firstvalue('001'), 'id-0001')
+
+
+class XMLTests(FileTestCase):
+
+    def test_roundtrip(self):
+        path = os.path.join(self.tempdir, 'records.xml')
+        with marcx.XMLWriter(path, chunk_records=4) as writer:
+            for record in marcx.iter_lazy(self.path):
+                writer.write(record)
+
+        records = list(marcx.iter_xml(path))
+        self.assertEqual(len(records), self.size)
+        self.assertTrue(all(isinstance(r, marcx.Record) for r in records))
+        with open(self.path, 'rb') as handle:
+            expected = [marcx.Record(data=data) for _, data in marcx._iter_raw_records(handle)]
+        self.assertEqual([r.as_marc() for r in records], [r.as_marc() for r in expected])
+
+        with open(path, 'rb') as handle:
+            parsed = pymarc.parse_xml_to_array(handle)
+        self.assertEqual([r.as_marc() for r in parsed], [r.as_marc() for r in expected])
+
+    def test_read_pymarc_xml_and_escaping(self):
+        record = _make_record(1)
+        record.add('500', a='<b> & "quoted"', indicators='1 ')
+        buf = io.BytesIO()
+        writer = pymarc.XMLWriter(buf)
+        writer.write(record)
+        writer.close(close_fh=False)
+        buf.seek(0)
+        parsed = list(marcx.iter_xml(buf, compact=True))
+        self.assertEqual(len(parsed), 1)
+        self.assertEqual(parsed[0].firstvalue('500.a'), '<b> & "quoted"')
+        self.assertEqual(parsed[0]['500'].indicators, pymarc.Indicators('1', ' '))
+        self.assertEqual(parsed[0].as_marc(), record.as_marc())
+
+        buf = io.BytesIO()
+        with marcx.XMLWriter(buf) as writer:
+            writer.write(record)
+        self.assertEqual(list(marcx.iter_xml(io.BytesIO(buf.getvalue())))[0].as_marc(),
+                         record.as_marc())
+
+    def test_wrapped_records(self):
+        doc = ('<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/"><ListRecords>'
+               '<record><metadata><record xmlns="http://www.loc.gov/MARC21/slim">'
+               '<leader>00000nam a2200000   4500</leader>'
+               '<controlfield tag="001">1</controlfield>'
+               '<datafield tag="245" ind1="1" ind2="0"><subfield code="a">T</subfield></datafield>'
+               '</record></metadata></record>'
+               '</ListRecords></OAI-PMH>')
+        records = list(marcx.iter_xml(io.BytesIO(doc.encode('utf-8'))))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].values('001', '245.a'), ['1', 'T'])
+
+    def test_wrapped_records_memory(self):
+        def peak(size):
+            record = ('<record><header><identifier>oai:%d</identifier></header><metadata>'
+                      '<record xmlns="http://www.loc.gov/MARC21/slim">'
+                      '<controlfield tag="001">1</controlfield></record></metadata></record>')
+            doc = ('<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/"><ListRecords>' +
+                   ''.join(record % i for i in range(size)) + '</ListRecords></OAI-PMH>')
+            source = io.BytesIO(doc.encode('utf-8'))
+            tracemalloc.start()
+            try:
+                for _ in marcx._iter_xml_elements(source):
+                    pass
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        self.assertLess(peak(5000), 2 * peak(500))
+
+    def test_non_numeric_control_fields(self):
+        doc = ('<collection xmlns="http://www.loc.gov/MARC21/slim"><record>'
+               '<leader>00000nam a2200000   4500</leader>'
+               '<controlfield tag="001">1</controlfield>'
+               '<controlfield tag="FMT">BK</controlfield>'
+               '<datafield tag="245" ind1="1" ind2="0"><subfield code="a">T</subfield></datafield>'
+               '</record></collection>')
+        for compact in (False, True):
+            record = next(marcx.iter_xml(io.BytesIO(doc.encode('utf-8')), compact=compact))
+            self.assertTrue(record['FMT'].control_field)
+            self.assertEqual(record['FMT'].data, 'BK')
+            self.assertIn(b'BK\x1e', record.as_marc())
+            buf = io.BytesIO()
+            with marcx.XMLWriter(buf) as writer:
+                writer.write(record)
+            self.assertEqual(next(marcx.iter_xml(io.BytesIO(buf.getvalue())))['FMT'].data, 'BK')
+
+
+class CommandTests(FileTestCase):
+
+    def run_command(self, *args):
+        output = os.path.join(self.tempdir, 'output')
+        marcx.main(list(args) + ['-o', output])
+        with open(output, 'rb') as handle:
+            return handle.read()
+
+    def test_count(self):
+        self.assertEqual(self.run_command('count', self.path), b'25\n')
+        self.assertEqual(self.run_command('count', self.path, self.path), b'50\n')
+        self.assertEqual(self.run_command('count', '-q', '001 $= "1"', self.path, '-w', '2'),
+                         b'3\n')
+
+    def test_filter_formats(self):
+        query = '245.a ~ /title 1/i'
+        data = self.run_command('filter', query, self.path, '-k')
+        with open(self.path, 'rb') as handle:
+            expected = [raw for _, raw in marcx._iter_raw_records(handle)]
+        self.assertEqual(data, b''.join(expected[1:2] + expected[10:20]))
+
+        for fmt, name in (('xml', 'records.xml'), ('json', 'records.jsonl')):
+            path = os.path.join(self.tempdir, name)
+            with open(path, 'wb') as handle:
+                handle.write(self.run_command('filter', query, self.path, '-t', fmt, '-w', '2', '-k'))
+            self.assertEqual(self.run_command('filter', query, path, '-t', 'marc'), data)
+            self.assertEqual(self.run_command('count', path), b'11\n')
+        self.assertEqual(self.run_command('filter', '001', path, '-k'),
+                         open(path, 'rb').read())
+
+    def test_json_non_numeric_control_fields(self):
+        path = os.path.join(self.tempdir, 'aleph.jsonl')
+        with open(path, 'w') as handle:
+            handle.write('{"leader": "00000nam a2200000   4500", "fields": [{"001": "1"}, '
+                         '{"FMT": "BK"}, {"245": {"ind1": "1", "ind2": "0", '
+                         '"subfields": [{"a": "T"}]}}]}\n')
+        self.assertEqual(self.run_command('count', '-q', '245.a = "T"', path), b'1\n')
+        record = marcx._json_to_record(json.loads(self.run_command('filter', '001', path)), {})
+        self.assertEqual(record['FMT'].data, 'BK')
+
+    def test_unordered(self):
+        data = self.run_command('filter', '001', self.path, '-w', '2', '--chunk-records', '3')
+        records = list(marcx._iter_raw_records(io.BytesIO(data)))
+        with open(self.path, 'rb') as handle:
+            expected = [raw for _, raw in marcx._iter_raw_records(handle)]
+        self.assertEqual(sorted(raw for _, raw in records), sorted(expected))
+
+    def test_extract(self):
+        data = self.run_command('extract', '001,245,999', '-q', '001 = "id-0003"', self.path)
+        self.assertEqual(data.decode('utf-8'), u'id-0003\tTitle 3|Author äöü\t\n')
+        data = self.run_command('extract', '001,245', '--first', self.path, '-k')
+        self.assertEqual(data.decode('utf-8').splitlines()[:2],
+                         ['id-0000\tTitle 0', 'id-0001\tTitle 1'])
+
+    def test_errors(self):
+        for args in (['count', '-q', '001 ='], ['extract', ''], ['filter', '001', 'missing.mrc']):
+            with self.assertRaises(SystemExit):
+                with open(os.devnull, 'w') as devnull:
+                    stderr, sys.stderr = sys.stderr, devnull
+                    try:
+                        marcx.main(args)
+                    finally:
+                        sys.stderr = stderr
+
+
+class GroupByTests(unittest.TestCase):
+
+    def make(self, *rows):
+        records = []
+        for i, (isbns, oclc) in enumerate(rows):
+            record = marcx.Record()
+            record.add('001', data='id-%d' % i)
+            for isbn in isbns:
+                record.add('020', a=isbn)
+            if oclc:
+                record.add('035', a=oclc)
+            records.append(record)
+        return records
+
+    def test_transitive_clusters(self):
+        records = self.make((['1', '2'], None), (['3'], 'x'), ([' 2 '], None),
+                            ([], None), ([], 'x'), (['4'], '1'), (['5'], 'y'), ([], '5'))
+        clusters = list(marcx.group_by(records, [('020.a', '776.z'), '035.a']))
+        self.assertEqual(clusters, [[0, 2], [1, 4], [3], [5], [6], [7]])
+        clusters = list(marcx.group_by(iter(records), ['020.a', '035.a'], min_size=2,
+                                       normalize=lambda v: v.strip() or None))
+        self.assertEqual(clusters, [[0, 2], [1, 4]])
+
+    def test_long_chain(self):
+        records = self.make(*[([str(i), str(i + 1)], None) for i in range(20)])
+        records.reverse()
+        self.assertEqual(list(marcx.group_by(records, ['020.a'], batch_size=3)),
+                         [list(range(20))])
+
+    def test_records_and_offsets(self):
+        records = self.make((['1'], None), (['2'], None), (['1'], None))
+        clusters = list(marcx.group_by(records, ['020.a'], keep_records=True, min_size=2))
+        self.assertEqual([[r['001'].data for r in c] for c in clusters], [['id-0', 'id-2']])
+        data = io.BytesIO(b''.join(r.as_marc() for r in records))
+        offsets = [offset for offset, _ in marcx._iter_raw_records(data)]
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'records.mrc')
+            with open(path, 'wb') as handle:
+                handle.write(data.getvalue())
+            clusters = list(marcx.group_by(marcx.iter_lazy(path), ['020.a'], tmpdir=tempdir))
+            self.assertEqual(clusters, [[offsets[0], offsets[2]], [offsets[1]]])
+            self.assertEqual(os.listdir(tempdir), ['records.mrc'])
+        finally:
+            shutil.rmtree(tempdir)
+
+
+class ChangeLogTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'fingerprints.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_fingerprint(self):
+        record = _make_record(1)
+        record.add('005', data='20200101')
+        data = record.as_marc()
+        fingerprint = record.fingerprint()
+        self.assertEqual(len(fingerprint), 32)
+        for other in (marcx.Record(data=data), marcx.LazyRecord(data),
+                      marcx.Record(data=data).compact(), record):
+            self.assertEqual(other.fingerprint(), fingerprint)
+        other = marcx.Record(data=data)
+        other['005'].data = '20210101'
+        self.assertEqual(other.fingerprint(), fingerprint)
+        self.assertNotEqual(other.fingerprint(exclude=()), fingerprint)
+        other['245']['c'] = 'Someone else'
+        self.assertNotEqual(other.fingerprint(), fingerprint)
+        self.assertEqual(other.fingerprint(exclude=('005', '245.c')),
+                         record.fingerprint(exclude=('245.c', '005')))
+        other = marcx.Record(data=data)
+        other['245'].indicators = ['1', '0']
+        self.assertNotEqual(other.fingerprint(), fingerprint)
+
+    def test_update(self):
+        records = [_make_record(i) for i in range(5)]
+        with marcx.ChangeLog(self.path) as log:
+            changes = list(log.update(records))
+            self.assertEqual([(status, key) for status, key, _ in changes],
+                             [('new', 'id-%04d' % i) for i in range(5)])
+            self.assertIs(changes[0][2], records[0])
+            self.assertEqual(list(log.update(records)), [])
+
+        records[1]['245']['a'] = 'New title'
+        records[3].add('005', data='20200101')
+        records = records[:2] + records[3:] + [_make_record(7), marcx.Record()]
+        with marcx.ChangeLog(self.path) as log:
+            self.assertEqual(len(log), 5)
+            changes = [(status, key) for status, key, _ in log.update(records, unchanged=True)]
+            self.assertEqual(changes, [(None, 'id-0000'), ('changed', 'id-0001'),
+                                       (None, 'id-0003'), (None, 'id-0004'),
+                                       ('new', 'id-0007'), ('deleted', 'id-0002')])
+            self.assertNotIn('id-0002', log)
+            self.assertEqual(log.get('id-0001'), records[1].fingerprint())
+
+    def test_interrupted_update(self):
+        with marcx.ChangeLog(self.path) as log:
+            list(log.update([_make_record(i) for i in range(3)]))
+            changes = log.update([_make_record(i) for i in range(3, 6)])
+            next(changes)
+            changes.close()
+            self.assertEqual(sorted(log.update([_make_record(0)], commit=False)),
+                             [('deleted', 'id-0001', None), ('deleted', 'id-0002', None)])
+            self.assertEqual(len(log), 3)
+
+
+class ApplyDeltaTests(FileTestCase):
+
+    def write_delta(self, records):
+        path = os.path.join(self.tempdir, 'delta.mrc')
+        with open(path, 'wb') as handle:
+            for record in records:
+                handle.write(record.as_marc())
+        return path
+
+    def test_apply_delta(self):
+        replaced = _make_record(3)
+        replaced['245']['a'] = 'Replaced'
+        deleted = _make_record(10)
+        deleted.leader = deleted.leader[:5] + 'd' + deleted.leader[6:]
+        added = _make_record(100)
+        twice = _make_record(20)
+        twice['245']['a'] = 'Twice'
+        delta = self.write_delta([_make_record(20), replaced, deleted, added, twice,
+                                  marcx.Record()])
+        out = os.path.join(self.tempdir, 'out.mrc')
+
+        stats = marcx.apply_delta(self.path, delta, out)
+        self.assertEqual(stats, {'replaced': 2, 'deleted': 1, 'added': 1})
+        self.assertTrue(os.path.exists(self.path + '.idx'))
+        ids = [r.firstvalue('001') for r in marcx.iter_lazy(out)]
+        expected = ['id-%04d' % i for i in range(self.size) if i != 10] + ['id-0100']
+        self.assertEqual(ids, expected)
+        titles = dict((r.firstvalue('001'), r.firstvalue('245.a')) for r in marcx.iter_lazy(out))
+        self.assertEqual(titles['id-0003'], 'Replaced')
+        self.assertEqual(titles['id-0020'], 'Twice')
+        self.assertEqual(titles['id-0004'], 'Title 4')
+
+        with open(self.path, 'rb') as handle:
+            base = handle.read()
+        buf = io.BytesIO()
+        self.assertEqual(marcx.apply_delta(self.path, self.write_delta([]), buf),
+                         {'replaced': 0, 'deleted': 0, 'added': 0})
+        self.assertEqual(buf.getvalue(), base)
+
+    def test_wrong_index_key(self):
+        marcx.build_index(self.path, key='020.a')
+        with self.assertRaises(ValueError):
+            marcx.apply_delta(self.path, self.write_delta([]), io.BytesIO())
@@ -3,6 +3,8 @@
 # pylint: disable=C0111
 
 import base64
+import io
+import random
 import unittest
 from builtins import range
 
@@ -461,3 +463,542 @@ class RecordTests(unittest.TestCase):
         self.assertEqual(len(obj.get_fields()), 1)
         print(obj)
         self.assertEqual(len(obj.get_fields()[0].subfields_as_dict()), 1)
+
+
+class FieldSpecTests(unittest.TestCase):
+
+    def test_parse(self):
+        spec = marcx.fieldspec('020.a')
+        self.assertEqual(spec.tag, '020')
+        self.assertEqual(spec.code, 'a')
+        self.assertFalse(spec.is_control)
+
+        spec = marcx.fieldspec('001')
+        self.assertEqual(spec.tag, '001')
+        self.assertIsNone(spec.code)
+        self.assertTrue(spec.is_control)
+
+        self.assertFalse(marcx.fieldspec('CAT').is_control)
+        self.assertIsNone(marcx.fieldspec(''))
+
+    def test_cached(self):
+        self.assertIs(marcx.fieldspec('245.a'), marcx.fieldspec('245.a'))
+        spec = marcx.fieldspec('245.a')
+        self.assertIs(marcx.fieldspec(spec), spec)
+
+    def test_getters_accept_compiled_specs(self):
+        obj = marcx.Record()
+        obj.add('001', data='123')
+        obj.add('020', a='978000', z='123')
+        spec = marcx.fieldspec('020.a')
+        self.assertEqual(list(marcx.valuegetter(spec, '001')(obj)), ['978000', '123'])
+        self.assertEqual([v for _, v in marcx.fieldgetter(spec)(obj)], ['978000'])
+
+    def test_fieldgetter_whole_field(self):
+        obj = marcx.Record()
+        obj.add('020', a='978000', z='123')
+        self.assertEqual([v for _, v in obj.iterfields('020')], ['978000', '123'])
+
+
+class TagIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.obj = marcx.Record()
+        self.obj.tag_index = True
+        self.obj.add('001', data='123')
+        self.obj.add('020', a='9783334444333')
+        self.obj.add('020', a='978000', z='123')
+        self.obj.add('776', x='978111')
+
+    def test_lookup(self):
+        self.assertEqual(self.obj.values('020.a'), ['9783334444333', '978000'])
+        self.assertEqual(len(self.obj.get_fields('020', '776')), 3)
+        self.assertEqual(self.obj.get_fields('999'), [])
+
+    def test_add_and_remove_keep_index_consistent(self):
+        self.assertTrue(self.obj.has('776'))
+        self.obj.add('020', a='4711')
+        self.assertEqual(self.obj.values('020.a'), ['9783334444333', '978000', '4711'])
+        self.obj.remove('020.a')
+        self.assertEqual(self.obj.values('020'), ['123'])
+        self.obj.remove_field_if('776.x', marcx._startswith('978'))
+        self.assertFalse(self.obj.has('776'))
+        self.obj.remove_field(self.obj['001'])
+        self.assertFalse(self.obj.has('001'))
+
+    def test_direct_fields_manipulation(self):
+        self.assertEqual(len(self.obj.get_fields('020')), 2)
+        self.obj.fields = self.obj.fields[:1]
+        self.assertEqual(self.obj.get_fields('020'), [])
+        self.obj.fields.append(pymarc.Field('020', subfields=[Subfield('a', 'x')]))
+        self.assertEqual(self.obj.values('020.a'), ['x'])
+        self.obj.fields[1] = pymarc.Field('021', subfields=[Subfield('a', 'y')])
+        self.obj.invalidate_index()
+        self.assertEqual(self.obj.values('021.a'), ['y'])
+
+        # Same length, so only invalidate_index picks up the change.
+        field = self.obj.fields[1]
+        self.obj.fields.remove(field)
+        self.obj.fields.append(pymarc.Field('022', subfields=[Subfield('a', 'z')]))
+        self.obj.invalidate_index()
+        self.assertEqual(self.obj.values('021.a', '022.a'), ['z'])
+
+
+class HasTests(unittest.TestCase):
+
+    def setUp(self):
+        self.obj = marcx.Record()
+        self.obj.add('001', data='123')
+        self.obj.add('020', a='9783334444333')
+        self.obj.add('776', x='978111')
+
+    def test_has_control_field(self):
+        self.assertTrue(self.obj.has('001'))
+        self.assertFalse(self.obj.has('001.a'))
+        self.assertFalse(self.obj.has('005'))
+
+    def test_has_any(self):
+        self.assertTrue(self.obj.has_any('020.z', '776.x'))
+        self.assertTrue(self.obj.has_any('005', '001'))
+        self.assertFalse(self.obj.has_any('020.z', '776.a', '999'))
+        self.assertFalse(self.obj.has_any())
+
+    def test_has_all(self):
+        self.assertTrue(self.obj.has_all('001', '020.a', '776'))
+        self.assertFalse(self.obj.has_all('001', '020.a', '020.z'))
+        self.assertTrue(self.obj.has_all())
+
+    def test_firstvalue_stops_at_first_value(self):
+        def fields():
+            yield pymarc.Field('020', subfields=[Subfield('a', 'first')])
+            raise AssertionError('firstvalue did not stop')
+
+        obj = marcx.Record()
+        obj.get_fields = lambda *args: fields()
+        self.assertEqual(obj.firstvalue('020.a'), 'first')
+
+
+class TestTests(unittest.TestCase):
+
+    def test_all_without_values(self):
+        obj = marcx.Record()
+        obj.add('020', a='978000')
+        self.assertFalse(obj.test('776.x', marcx._startswith('978'), all=True))
+        self.assertTrue(obj.test('020.a', marcx._startswith('978'), all=True))
+
+    def test_all_short_circuits(self):
+        obj = marcx.Record()
+        obj.add('020', a='123', z='978000')
+        seen = []
+
+        def check(value):
+            seen.append(value)
+            return value.startswith('978')
+
+        self.assertFalse(obj.test('020.a', '020.z', check, all=True))
+        self.assertEqual(seen, ['123'])
+
+    def test_many(self):
+        records = []
+        for isbn in ('978000', '123', None, '9781'):
+            obj = marcx.Record()
+            if isbn:
+                obj.add('020', a=isbn)
+            records.append(obj)
+
+        mask = marcx.test_many(records, '020.a', marcx._startswith('978'))
+        self.assertEqual(mask, bytearray([1, 0, 0, 1]))
+        mask = marcx.test_many(iter(records), '020.a')
+        self.assertEqual(list(mask), [1, 1, 0, 1])
+        mask = marcx.test_many(records, '020.a', '020.z', marcx._startswith('978'), all=True)
+        self.assertEqual(list(mask), [1, 0, 0, 1])
+
+
+class QueryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.record = marcx.Record()
+        self.record.add('001', data='123')
+        self.record.add('020', a='9780201616224')
+        self.record.add('245', a='Foo and bar', c='Someone')
+        self.record.add('912', a='ZDB-1-Y')
+
+    def test_operators(self):
+        obj = self.record
+        self.assertTrue(obj.matches('001 = "123"'))
+        self.assertTrue(obj.matches('020.a ^= "978"'))
+        self.assertTrue(obj.matches('020.a $= "224"'))
+        self.assertTrue(obj.matches('245.a *= "and"'))
+        self.assertTrue(obj.matches('245.a ~ /^foo/i'))
+        self.assertTrue(obj.matches("245.a ~ '^F'"))
+        self.assertFalse(obj.matches('245.a ~ /^foo/'))
+        self.assertTrue(obj.matches('912.a != "ZDB-1-X"'))
+        self.assertFalse(obj.matches('912.a != "ZDB-1-Y"'))
+        self.assertTrue(obj.matches('245'))
+        self.assertFalse(obj.matches('245.x'))
+
+    def test_boolean_expressions(self):
+        obj = self.record
+        self.assertTrue(obj.matches(
+            '020.a ^= "978" and not 912.a = "ZDB-1-X" and 245.a ~ /foo/i'))
+        self.assertTrue(obj.matches('100.a = "x" or 245.c = "Someone"'))
+        self.assertFalse(obj.matches('(100.a = "x" or 245.c = "x") and 001'))
+        self.assertTrue(obj.matches('NOT (100 OR 700) AND 001'))
+        self.assertTrue(obj.matches(r'245.a != "say \"hi\""'))
+
+    def test_regex_strings(self):
+        obj = marcx.Record()
+        obj.add('245', a='abc 123', b='say "hi"')
+        self.assertTrue(obj.matches(r'245.a ~ "\d+"'))
+        self.assertTrue(obj.matches(r"245.a ~ '^abc\s\d{3}$'"))
+        self.assertFalse(obj.matches(r'245.a ~ "\d{4}"'))
+        self.assertTrue(obj.matches(r'245.b ~ "\"hi\"$"'))
+        self.assertTrue(obj.matches(r'245.b = "say \"hi\""'))
+        self.assertTrue(obj.matches(r"245.a ~ /\d+/"))
+
+    def test_tag_pruning(self):
+        seen = []
+
+        class Spy(marcx.Record):
+            def get_fields(self, *tags):
+                fields = super(Spy, self).get_fields(*tags)
+                seen.append(tags)
+                return fields
+
+        obj = Spy()
+        obj.add('245', a='Foo')
+        matches = marcx.query('(020.a ^= "978" or 776.z) and 245.a = "Foo"')
+        self.assertFalse(matches(obj))
+        self.assertEqual(seen, [('020', '245', '776')])
+        obj.add('776', z='1')
+        self.assertTrue(matches(obj))
+
+    def test_compiled_once(self):
+        self.assertIs(marcx.query('001 = "1"'), marcx.query('001 = "1"'))
+        self.assertEqual(list(filter(marcx.query('001'), [self.record, marcx.Record()])),
+                         [self.record])
+
+    def test_invalid_queries(self):
+        for expr in ('', '020.a =', '020.a = "x" and', '(001', '001)',
+                     '020.a ^= /x/', '245.a ~ /(/', '245.a ~ /x/q', '001 # "1"',
+                     '020.a = "x" 001'):
+            with self.assertRaises(ValueError):
+                marcx.query(expr)
+
+
+class MultiPatternTests(unittest.TestCase):
+
+    def test_any_prefix(self):
+        is_isil = marcx.any_prefix(['DE-15', 'DE-14', 'DE-1', 'DE-Ch1'])
+        self.assertTrue(is_isil('DE-15'))
+        self.assertTrue(is_isil('DE-105'))
+        self.assertTrue(is_isil('DE-Ch1-x'))
+        self.assertFalse(is_isil('DE-Ch'))
+        self.assertFalse(is_isil('DE-'))
+        self.assertFalse(is_isil(''))
+        self.assertTrue(marcx.any_prefix(['', 'x'])('abc'))
+        self.assertFalse(marcx.any_prefix([])('abc'))
+        self.assertTrue(marcx.any_prefix('de-1', ignorecase=True)('DE-15'))
+
+    def test_any_substring(self):
+        matches = marcx.any_substring(['he', 'she', 'his', 'hers'])
+        for value in ('ushers', 'xhis', 'she', 'ahex'):
+            self.assertTrue(matches(value), value)
+        for value in ('', 'hi', 'shx', 'h e'):
+            self.assertFalse(matches(value), value)
+        self.assertTrue(marcx.any_substring(['abcd', 'bc'])('xabcx'))
+        self.assertTrue(marcx.any_substring(['SPRINGER'], ignorecase=True)('Springer-Verlag'))
+        self.assertFalse(marcx.any_substring([])('abc'))
+
+    def test_against_naive_matching(self):
+        rnd = random.Random(42)
+        patterns = [''.join(rnd.choice('abc') for _ in range(rnd.randint(1, 4)))
+                    for _ in range(30)]
+        prefix, substring = marcx.any_prefix(patterns), marcx.any_substring(patterns)
+        for _ in range(500):
+            value = ''.join(rnd.choice('abcd') for _ in range(rnd.randint(0, 8)))
+            self.assertEqual(prefix(value), any(value.startswith(p) for p in patterns))
+            self.assertEqual(substring(value), any(p in value for p in patterns))
+
+    def test_record_predicates(self):
+        obj = marcx.Record()
+        obj.add('912', a='ZDB-1-X')
+        obj.add('912', a='DE-15')
+        self.assertTrue(obj.test('912.a', marcx.any_prefix(['ZDB-2', 'ZDB-1'])))
+        removed = obj.remove_field_if('912.a', marcx.any_substring(['-15']))
+        self.assertEqual([field['a'] for field in removed], ['DE-15'])
+        self.assertTrue(obj.test('912.a', marcx._match('ZDB')))
+        self.assertFalse(obj.test('912.a', marcx._search('^X')))
+
+
+class CompactTests(unittest.TestCase):
+
+    def test_decode_compact(self):
+        obj = marcx.Record(data=MARCREC, to_unicode=True, force_utf8=True, compact=True)
+        self.assertTrue(all(isinstance(f, marcx.CompactField) for f in obj.fields))
+        self.assertEqual(obj.as_marc(), MARCREC)
+        self.assertEqual(obj.firstvalue('260.a'), 'Linz :')
+        self.assertEqual(obj.values('689.0'), ['(DE-588)118618156', '(DE-576)163200580'])
+
+    def test_same_behaviour(self):
+        for compact in (False, True):
+            obj = marcx.Record(compact=compact)
+            obj.add('001', data='123')
+            obj.add('020', a='978000', b='123', c='123')
+            obj.add('020', a='1', a_=['2', '3'])
+            self.assertEqual(obj.values('020.a'), ['978000', '1', '2', '3'])
+            self.assertEqual(obj['020']['b'], '123')
+            self.assertTrue(obj.has('020.c'))
+            obj.remove('020.b')
+            self.assertEqual(obj.get_fields('020')[0].subfields,
+                             [Subfield('a', '978000'), Subfield('c', '123')])
+            obj.remove_field_if('020.a', marcx._equals('2'))
+            self.assertEqual(len(obj.get_fields('020')), 1)
+            self.assertEqual(obj.flatten(), ['123', '978000', '123'])
+
+    def test_field_methods(self):
+        field = marcx.CompactField('245', ['1', '0'], [Subfield('a', 'Title'), Subfield('c', 'Me')])
+        self.assertEqual(field.indicators, pymarc.Indicators('1', '0'))
+        self.assertEqual(field.get('c'), 'Me')
+        self.assertEqual(field.get('x', 'default'), 'default')
+        field['a'] = 'Other'
+        field.add_subfield('b', 'Sub', pos=1)
+        self.assertEqual(field.value(), 'Other Sub Me')
+        self.assertEqual(field.delete_subfield('c'), 'Me')
+        self.assertEqual(str(field), '=245  10$aOther$bSub')
+        self.assertEqual(field.subfields_as_dict(), {'a': ['Other'], 'b': ['Sub']})
+        with self.assertRaises(KeyError):
+            field['x']
+
+    def test_codes_and_delimiters(self):
+        field = marcx.CompactField('245', ['1', '0'], [Subfield('a', 'a'), Subfield('b', 'b')])
+        plain = pymarc.Field('245', ['1', '0'], [Subfield('a', 'a'), Subfield('b', 'b')])
+        for code in ('ab', 'a', 'x', ''):
+            self.assertEqual(code in field, code in plain)
+            self.assertEqual(field.get(code, 'default'), plain.get(code, 'default'))
+        self.assertEqual(field.delete_subfield('ab'), None)
+        with self.assertRaises(KeyError):
+            field['ab']
+        with self.assertRaises(KeyError):
+            field['ab'] = 'x'
+
+        with self.assertRaises(ValueError):
+            field['a'] = 'a\x1fb'
+        with self.assertRaises(ValueError):
+            field.add_subfield('c', 'c\x1fd')
+        obj = marcx.Record(compact=True)
+        with self.assertRaises(ValueError):
+            obj.add('245', a='a\x1fb', c='z')
+        with self.assertRaises(ValueError):
+            obj.add_many([('245', '10', [('a', 'a\x1fb'), ('c', 'z')])])
+        self.assertEqual(obj.fields, [])
+        self.assertEqual(field.subfields, [Subfield('a', 'a'), Subfield('b', 'b')])
+
+    def test_compact_existing_record(self):
+        obj = marcx.Record(data=MARCREC, to_unicode=True, force_utf8=True)
+        before = str(obj)
+        obj.compact()
+        self.assertEqual(str(obj), before)
+        obj.add('999', a='x')
+        self.assertTrue(isinstance(obj['999'], marcx.CompactField))
+
+    def test_memory(self):
+        import tracemalloc
+        from marcx import synth
+
+        data = [record.as_marc() for record in synth.generate(100, profile='bibliographic')]
+        sizes = []
+        for compact in (False, True):
+            tracemalloc.start()
+            records = [marcx.Record(data=item, compact=compact) for item in data]
+            sizes.append(tracemalloc.get_traced_memory()[0])
+            tracemalloc.stop()
+            del records
+        # About 2.7 times, see `Record.compact`.
+        self.assertGreater(sizes[0], 2.5 * sizes[1])
+
+
+class ExtractTests(unittest.TestCase):
+
+    def setUp(self):
+        self.records = []
+        for i, isbns in enumerate([['978000', '978111'], [], ['123']]):
+            obj = marcx.Record()
+            obj.add('001', data='%s' % i)
+            if isbns:
+                obj.add('020', a=isbns)
+            obj.add('245', a='Title %s' % i)
+            self.records.append(obj)
+
+    def test_list(self):
+        columns = marcx.extract(self.records, {'id': '001', 'isbn': '020.a'})
+        self.assertEqual(list(columns['id']), [['0'], ['1'], ['2']])
+        isbn = columns['isbn']
+        self.assertEqual(len(isbn), 3)
+        self.assertEqual(isbn.values, ['978000', '978111', '123'])
+        self.assertEqual(list(isbn.offsets), [0, 2, 2, 3])
+        self.assertEqual(isbn[0], ['978000', '978111'])
+        self.assertEqual(isbn[-1], ['123'])
+
+    def test_first_and_join(self):
+        specs = {'isbn': '020.a', 'any': ('020.a', '245.a')}
+        columns = marcx.extract(self.records, specs, multi='first')
+        self.assertEqual(columns['isbn'], ['978000', None, '123'])
+        self.assertEqual(columns['any'], ['978000', 'Title 1', '123'])
+        columns = marcx.extract(self.records, specs, multi='join', sep='|')
+        self.assertEqual(columns['isbn'], ['978000|978111', None, '123'])
+
+    def test_batches(self):
+        batches = list(marcx.iterextract(iter(self.records), {'id': '001'},
+                                         multi='first', batch_size=2))
+        self.assertEqual([b['id'] for b in batches], [['0', '1'], ['2']])
+
+    def test_empty_and_invalid(self):
+        self.assertEqual(marcx.extract([], {'id': '001'}, multi='first'), {'id': []})
+        with self.assertRaises(ValueError):
+            marcx.extract(self.records, {'id': '001'}, multi='all')
+
+
+class RemoveTests(unittest.TestCase):
+
+    def test_remove_many(self):
+        obj = marcx.Record()
+        obj.add('001', data='123')
+        obj.add('020', a='978000', z='123', _9='x')
+        obj.add('020', z='456')
+        obj.add('912', a='ZDB-1')
+        obj.add('245', a='Title')
+        fields = obj.fields
+        obj.remove('001', '020.z', '020.9', '912', '999.a')
+        self.assertIs(obj.fields, fields)
+        self.assertEqual([f.tag for f in obj.fields], ['020', '245'])
+        self.assertEqual(obj['020'].subfields, [Subfield('a', '978000')])
+
+    def test_remove_subfield_keeps_control_fields(self):
+        obj = marcx.Record()
+        obj.add('001', data='123')
+        obj.remove('001.a')
+        self.assertEqual(obj.values('001'), ['123'])
+
+    def test_remove_nothing(self):
+        obj = marcx.Record()
+        obj.add('020', a='978000')
+        obj.remove()
+        obj.remove('020.z')
+        self.assertEqual(obj.values('020.a'), ['978000'])
+
+
+class RemoveFieldIfTests(unittest.TestCase):
+
+    def test_field_removed_once(self):
+        obj = marcx.Record()
+        obj.add('020', a=['978000', '978111'], z='978222')
+        obj.add('020', a='123')
+        removed = obj.remove_field_if('020.a', '020.z', marcx._startswith('978'))
+        self.assertEqual(len(removed), 1)
+        self.assertEqual(obj.values('020.a'), ['123'])
+
+    def test_rules(self):
+        obj = marcx.Record()
+        obj.add('001', data='123')
+        obj.add('020', a='978000')
+        obj.add('020', a='123')
+        obj.add('912', a='ZDB-1-X')
+        obj.add('912', a='ZDB-2-Y')
+        removed = obj.remove_field_if({
+            '020.a': marcx._startswith('978'),
+            '912.a': marcx._equals('ZDB-1-X'),
+            '999.a': marcx._equals('x'),
+        })
+        self.assertEqual([f.tag for f in removed], ['020', '912'])
+        self.assertEqual(obj.values('020.a', '912.a'), ['123', 'ZDB-2-Y'])
+        self.assertEqual(obj.remove_field_if({'001': marcx._equals('124')}), [])
+        self.assertEqual(len(obj.remove_field_if({'001': marcx._equals('123')})), 1)
+
+    def test_invalid_rule(self):
+        obj = marcx.Record()
+        with self.assertRaises(ValueError):
+            obj.remove_field_if({'020.a': 'x'})
+        with self.assertRaises(ValueError):
+            obj.remove_field_if('020.a', 1)
+
+
+class AddManyTests(unittest.TestCase):
+
+    rows = [
+        ('001', None, '123'),
+        ('020', None, [('a', '978000'), ('z', '123')]),
+        ('245', '10', [('a', 'Title'), ('b', ''), ('c', 'Me')]),
+        ('650', ['0', '7'], [Subfield('a', 'Subject')]),
+    ]
+
+    def test_add_many(self):
+        for trusted in (False, True):
+            obj = marcx.Record()
+            obj.add_many(self.rows, trusted=trusted)
+            self.assertEqual(obj.values('001', '020.z', '650.a'), ['123', '123', 'Subject'])
+            self.assertEqual(obj['245'].indicators, pymarc.Indicators('1', '0'))
+            self.assertEqual(obj['650'].indicators, pymarc.Indicators('0', '7'))
+        self.assertEqual(obj['245'].get_subfields('b'), [''])
+
+    def test_same_as_add(self):
+        obj = marcx.Record()
+        obj.add('001', data='123')
+        obj.add('020', a='978000', z='123')
+        obj.add('245', a='Title', b='', c='Me', indicators='10')
+        obj.add('650', a='Subject', indicators='07')
+        self.assertEqual(obj.as_marc(), marcx.Record.from_fields(self.rows).as_marc())
+
+    def test_from_fields(self):
+        obj = marcx.Record.from_fields(self.rows, leader='00000nam a2200000   4500',
+                                       compact=True)
+        self.assertEqual(obj.leader[5:8], 'nam')
+        self.assertTrue(isinstance(obj['245'], marcx.CompactField))
+        self.assertEqual(obj.firstvalue('245.c'), 'Me')
+
+    def test_validation(self):
+        obj = marcx.Record()
+        for row in [('001', '00', 'x'), ('001', None, ''), ('001', None, [('a', 'b')]),
+                    ('020', 'abc', [('a', 'x')]), ('020', None, 'data'),
+                    ('020', None, [('a', 1)]), ('020', None, [('a', '')])]:
+            with self.assertRaises(ValueError):
+                obj.add_many([row])
+        self.assertEqual(obj.fields, [])
+
+        obj.strict = False
+        obj.add_many([('001', None, ''), ('020', None, [('a', '')]), ('020', None, [('a', 'x')])])
+        self.assertEqual(obj.values('001', '020.a'), ['x'])
+
+
+class FlattenTests(unittest.TestCase):
+
+    def setUp(self):
+        self.obj = marcx.Record(data=MARCREC, to_unicode=True, force_utf8=True)
+
+    def test_flatten_unchanged(self):
+        d = self.obj.as_dict()
+        del d['leader']
+        expected = [s for s in [v.strip() for v in marcx.flatten(d)] if s]
+        self.assertEqual(self.obj.flatten(), expected)
+        self.assertEqual(list(self.obj.iterflat()), expected)
+
+    def test_include_exclude(self):
+        self.assertEqual(list(self.obj.iterflat(include='041')), ['0', 'ger', '0', '7', 'dt.'])
+        self.assertEqual(list(self.obj.iterflat(include=('001', '041.a'))),
+                         ['000119652', 'ger', 'dt.'])
+        self.assertEqual(list(self.obj.iterflat(include='041', indicators=False)), ['ger', 'dt.'])
+        values = list(self.obj.iterflat(exclude=('001', '003', '005', '007', '008', '689.0')))
+        self.assertNotIn('000119652', values)
+        self.assertNotIn('(DE-588)118618156', values)
+        self.assertIn('Stifter, Adalbert', values)
+
+    def test_write_corpus(self):
+        other = marcx.Record()
+        other.add('245', a='Hello\nWorld ')
+        buf = io.StringIO()
+        lines = marcx.write_corpus([other, marcx.Record(), self.obj], buf,
+                                   include=('245.a',), sep='|')
+        self.assertEqual(lines, 2)
+        lines = buf.getvalue().splitlines()
+        self.assertEqual(lines[0], 'Hello World')
+        self.assertTrue(lines[1].startswith('Schriftenreihe des Adalbert-Stifter-Institutes'))
@@ -0,0 +1,118 @@
+# coding: utf-8
+# pylint: disable=C0111
+
+"""
+Tests for synthetic records.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import marcx
+from marcx import synth
+
+
+def _count(records, prefix):
+    return sum(1 for record in records for field in record.get_fields()
+               if field.tag.startswith(prefix))
+
+
+class GenerateTests(unittest.TestCase):
+
+    def test_deterministic(self):
+        first = [r.as_marc() for r in synth.generate(20, seed=1)]
+        self.assertEqual(first, [r.as_marc() for r in synth.generate(20, seed=1)])
+        self.assertEqual(first[:5], [r.as_marc() for r in synth.generate(5, seed=1)])
+        self.assertNotEqual(first, [r.as_marc() for r in synth.generate(20, seed=2)])
+        self.assertEqual([r.firstvalue('001') for r in synth.generate(3)],
+                         ['000000001', '000000002', '000000003'])
+
+    def test_records(self):
+        for profile in synth.PROFILES:
+            for record in synth.generate(20, seed=3, profile=profile, compact=True):
+                self.assertIsInstance(record, marcx.Record)
+                self.assertTrue(record.compact_fields)
+                tags = [field.tag for field in record.get_fields()]
+                self.assertEqual(tags, sorted(tags))
+                self.assertTrue(all(field.control_field or field.subfields
+                                    for field in record.get_fields()))
+                self.assertEqual(marcx.Record(data=record.as_marc()).as_marc(), record.as_marc())
+
+    def test_profiles(self):
+        plain = list(synth.generate(50, seed=4))
+        self.assertGreater(_count(synth.generate(50, seed=4, profile='subject_chains'), '689'),
+                           5 * _count(plain, '689'))
+        self.assertGreater(_count(synth.generate(50, seed=4, profile='heavy_9xx'), '9'),
+                           5 * _count(plain, '9'))
+        contents = list(synth.generate(50, seed=4, profile='contents'))
+        self.assertTrue(all(record['505'] for record in contents))
+        holdings = list(synth.generate(50, seed=4, profile='holdings'))
+        self.assertTrue(all(record.has('852.a') and not record.has('245') for record in holdings))
+        custom = {'fields': [('001', (1, 1), None, 'id'),
+                             ('245', (1, 1), '00', [('a', (1, 1), (5, 5))])]}
+        record = next(synth.generate(1, profile=custom))
+        self.assertEqual([field.tag for field in record.get_fields()], ['001', '245'])
+        with self.assertRaises(ValueError):
+            list(synth.generate(1, profile='missing'))
+
+    def test_scaling(self):
+        def size(**kwargs):
+            records = list(synth.generate(50, seed=5, **kwargs))
+            fields = [f for r in records for f in r.get_fields() if not f.control_field]
+            return (len(fields), sum(len(f.subfields) for f in fields) / float(len(fields)),
+                    sum(len(r.as_marc()) for r in records))
+        fields, subfields, length = size()
+        self.assertGreater(size(fields=2)[0], 1.5 * fields)
+        # Required single subfields do not scale.
+        self.assertGreater(size(subfields=3)[1], 1.25 * subfields)
+        self.assertGreater(size(lengths=3)[2], 1.5 * length)
+
+
+class WriteTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_marc(self):
+        expected = b''.join(r.as_marc() for r in synth.generate(30, seed=6, profile='contents'))
+        path = os.path.join(self.tempdir, 'synth.mrc')
+        self.assertEqual(synth.write(path, 30, seed=6, profile='contents'), 30)
+        with open(path, 'rb') as handle:
+            self.assertEqual(handle.read(), expected)
+        buf = io.BytesIO()
+        synth.write(buf, 30, seed=6, profile='contents', workers=2, chunk_records=7)
+        self.assertEqual(buf.getvalue(), expected)
+
+    def test_size_limits(self):
+        buf = io.BytesIO()
+        synth.write(buf, 200, seed=1, profile='contents', lengths=2)
+        records = list(marcx._iter_raw_records(io.BytesIO(buf.getvalue())))
+        self.assertEqual(len(records), 200)
+        for _, data in records:
+            record = marcx.Record(data=data)
+            self.assertLessEqual(len(data), 99999)
+            self.assertTrue(all(len(field.as_marc('utf-8')) <= 9999
+                                for field in record.get_fields()))
+        self.assertGreater(max(len(data) for _, data in records), 30000)
+
+        buf = io.BytesIO()
+        synth.write(buf, 5, seed=1, profile='contents', lengths=30, subfields=10)
+        records = [data for _, data in marcx._iter_raw_records(io.BytesIO(buf.getvalue()))]
+        self.assertEqual(len(records), 5)
+        self.assertTrue(all(len(data) <= 99999 for data in records))
+        self.assertEqual(records, [r.as_marc() for r in synth.generate(
+            5, seed=1, profile='contents', lengths=30, subfields=10)])
+
+    def test_xml(self):
+        path = os.path.join(self.tempdir, 'synth.xml')
+        synth.write(path, 12, seed=7, format='xml', chunk_records=5)
+        self.assertEqual([r.as_marc() for r in marcx.iter_xml(path)],
+                         [r.as_marc() for r in synth.generate(12, seed=7)])
+        with self.assertRaises(ValueError):
+            synth.write(path, 1, format='json')